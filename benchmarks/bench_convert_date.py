@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of convert_date against the find/replace implementation it replaced
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_convert_date [--sizes 1000 10000 100000] [--repeat 3]
+"""
+
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime
+
+from fancy_abak.abak_shared_functions.requests_functions import convert_date
+
+
+def legacy_convert_date(text):
+    start = text.find("new Date")
+    finish = text.find("),", start) + 1
+    next_instance = finish
+    while next_instance > 0:
+        date_to_convert = text[start:finish]
+        date_to_convert_array = date_to_convert[
+            date_to_convert.find("(") + 1 : date_to_convert.find(")")
+        ].split(",")
+        date_output = f'"{date_to_convert_array[0]}-{int(date_to_convert_array[1])+1:02d}-{date_to_convert_array[2]}T00:00:00"'
+        text = text.replace(date_to_convert, date_output)
+        start = text.find("new Date", next_instance)
+        finish = text.find("),", start) + 1
+        next_instance = finish
+
+    return text
+
+
+def build_payload(entries, seed=42):
+    """
+    Builds a GetGroupedTransacts-like body with one "new Date(...)" per entry, spread over a year
+    """
+    generator = random.Random(seed)
+    rows = []
+    for index in range(entries):
+        rows.append(
+            '{"Id":"%d","Date":new Date(2023,%d,%d),"ProjectName":"Project %d",'
+            '"Description":"Something Meaningful","Quantity":%d}'
+            % (
+                index,
+                generator.randint(0, 11),
+                generator.randint(1, 28),
+                generator.randint(1, 40),
+                generator.randint(1, 8),
+            )
+        )
+    return '{"success":true,"total":%d,"data":[%s]}' % (entries, ",".join(rows))
+
+
+def parsed_dates(text):
+    return [
+        datetime.strptime(row["Date"], "%Y-%m-%dT%H:%M:%S")
+        for row in json.loads(text)["data"]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments = parser.parse_args()
+
+    print(
+        f"{'entries':>8} {'bytes':>10} {'legacy (s)':>11} {'regex (s)':>10} {'speedup':>8}"
+    )
+    for size in arguments.sizes:
+        payload = build_payload(size)
+        if parsed_dates(convert_date(payload)) != parsed_dates(
+            legacy_convert_date(payload)
+        ):
+            raise SystemExit(f"implementations disagree for {size} entries")
+        legacy = min(
+            timeit.repeat(
+                lambda: legacy_convert_date(payload), number=1, repeat=arguments.repeat
+            )
+        )
+        current = min(
+            timeit.repeat(
+                lambda: convert_date(payload), number=1, repeat=arguments.repeat
+            )
+        )
+        print(
+            f"{size:>8} {len(payload):>10} {legacy:>11.4f} {current:>10.4f} {legacy / current:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+End-to-end benchmark of the abak commands against the local mock Abak server
+
+Each command runs in its own process, like a user would run it, with a temporary config
+pointing to the mock server. For each one the benchmark reports the wall time, the
+requests made, the connections opened and the bytes transferred.
+
+A run can be saved as a baseline and later runs compared to it: the benchmark fails when
+a command makes more requests than the baseline, or is slower by more than the tolerance.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_e2e [--latency 0.05] [--repeat 3] [--only "timesheet list"]
+        [--save-baseline benchmarks/baseline.json] [--baseline benchmarks/baseline.json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import date, timedelta
+
+from benchmarks.mock_abak_server import EMPLOYEE_ID, TOKEN, USERNAME, start_server
+
+DEFAULT_TOLERANCE = 0.2
+ABAK = "import sys; from fancy_abak.abak import abak; abak(prog_name='abak')"
+
+
+def write_config(config_home, server, dataset):
+    """
+    Writes a logged in configuration for the mock server, with a context per project
+    of the first client
+    """
+    app_dir = os.path.join(config_home, ".abakctl")
+    os.makedirs(app_dir, exist_ok=True)
+    config = {
+        "token": TOKEN,
+        "endpoint": server.url,
+        "username": USERNAME,
+        "fancy_abak_endpoint": server.url,
+        "abak_date_format": "Y-M-d",
+        "date_format": "%Y-%m-%d",
+        "access_token": "Bearer bench",
+        "user_id": EMPLOYEE_ID,
+        "user_id_validated_at": time.time(),
+        "contexts": {
+            f"context-{index}": {
+                "Client": project["ClientId"],
+                "Project": project["Id"],
+                "Price": 100 + index,
+            }
+            for index, project in enumerate(dataset["projects"][:5])
+        },
+    }
+    with open(os.path.join(app_dir, "config.json"), "w") as file_writer:
+        file_writer.write(json.dumps(config))
+
+
+def write_apply_file(directory, dataset, days=10):
+    """
+    Writes an apply file for the last weekdays that keeps half of the existing entries,
+    changes the hours of the other half and adds a new entry per day
+    """
+    today = date.today()
+    weekdays = [
+        today - timedelta(days=offset)
+        for offset in range(days * 2)
+        if (today - timedelta(days=offset)).weekday() < 5
+    ][:days]
+    projects = {}
+    for row in dataset["transactions"].values():
+        if row["Date"] not in weekdays:
+            continue
+        hours = row["Quantity"] if int(row["Id"][1:]) % 2 else row["Quantity"] + 1
+        projects.setdefault((row["ClientId"], row["ProjectId"]), []).append(
+            {
+                "date": row["Date"].isoformat(),
+                "hours": hours,
+                "description": row["Description"],
+            }
+        )
+    new_project = dataset["projects"][0]
+    projects.setdefault((new_project["ClientId"], new_project["Id"]), []).extend(
+        {"date": day.isoformat(), "hours": 1, "description": "Benchmark entry"}
+        for day in weekdays
+    )
+    clients = {}
+    for (client_id, project_id), entries in projects.items():
+        clients.setdefault(client_id, []).append(
+            {"projectId": project_id, "entries": entries}
+        )
+    file_path = os.path.join(directory, "apply.json")
+    with open(file_path, "w") as file_writer:
+        file_writer.write(
+            json.dumps(
+                {
+                    "clients": [
+                        {"clientId": client_id, "projects": client_projects}
+                        for client_id, client_projects in clients.items()
+                    ]
+                }
+            )
+        )
+    return file_path
+
+
+def get_scenarios(apply_file, dataset):
+    today = date.today()
+    # The last Wednesday, so that the week always has entries
+    reference_day = today - timedelta(days=(today.weekday() - 2) % 7)
+    month_start = today.replace(day=1).isoformat()
+    transaction_id = next(iter(dataset["transactions"]))
+    # name: (arguments, standard input, whether it changes the dataset, whether it runs
+    # with the catalogs already cached)
+    return {
+        "timesheet list": (
+            ["timesheet", "list", "-d", reference_day.isoformat()],
+            None,
+            False,
+            False,
+        ),
+        "timesheet list monthly totals": (
+            ["timesheet", "list", "-r", "Monthly", "--show-totals"],
+            None,
+            False,
+            False,
+        ),
+        "client list --refresh": (["client", "list", "--refresh"], None, False, False),
+        "client list (cached)": (["client", "list"], None, False, True),
+        "project list --refresh": (
+            ["project", "list", "--all-projects", "--refresh"],
+            None,
+            False,
+            False,
+        ),
+        "timesheet apply --dry-run": (
+            ["timesheet", "apply", "-f", apply_file, "--dry-run"],
+            None,
+            False,
+            False,
+        ),
+        "timesheet apply": (
+            ["timesheet", "apply", "-f", apply_file],
+            None,
+            True,
+            False,
+        ),
+        "timesheet set": (
+            [
+                "timesheet",
+                "set",
+                "-c",
+                dataset["projects"][0]["ClientId"],
+                "-p",
+                dataset["projects"][0]["Id"],
+                "-d",
+                "Benchmark entry",
+                "-h",
+                "1",
+                "--date",
+                today.isoformat(),
+            ],
+            None,
+            True,
+            False,
+        ),
+        "timesheet delete": (
+            ["timesheet", "delete", transaction_id],
+            None,
+            True,
+            False,
+        ),
+        "timesheet approve": (
+            ["timesheet", "approve", "-s", month_start, "-e", today.isoformat()],
+            "y\n",
+            True,
+            False,
+        ),
+    }
+
+
+def server_call(server, path):
+    request = urllib.request.Request(
+        server.url + path, method="POST" if "reset" in path else "GET"
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def run_abak(environment, arguments, standard_input):
+    result = subprocess.run(
+        [sys.executable, "-c", ABAK, *arguments],
+        env=environment,
+        input=standard_input,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(
+            f"abak {' '.join(arguments)} failed:\n{result.stdout}{result.stderr}"
+        )
+
+
+def run_scenario(server, environment, arguments, standard_input, changes_data, cached):
+    if cached:
+        run_abak(environment, arguments, standard_input)
+    else:
+        shutil.rmtree(
+            os.path.join(environment["XDG_CONFIG_HOME"], ".abakctl", "cache"),
+            ignore_errors=True,
+        )
+    server_call(server, "/__reset?data=1" if changes_data else "/__reset")
+    started = time.perf_counter()
+    run_abak(environment, arguments, standard_input)
+    elapsed = time.perf_counter() - started
+    stats = server_call(server, "/__stats")
+    return {
+        "wall": elapsed,
+        "requests": stats["requests"],
+        "connections": stats["connections"],
+        "bytes_sent": stats["bytes_received"],
+        "bytes_received": stats["bytes_sent"],
+    }
+
+
+def compare(results, baseline, tolerance):
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if result["requests"] > expected["requests"]:
+            failures.append(
+                f"{name}: {result['requests']} requests, baseline is {expected['requests']}"
+            )
+        if result["wall"] > expected["wall"] * (1 + tolerance):
+            failures.append(
+                f"{name}: {result['wall']:.3f}s, baseline is {expected['wall']:.3f}s"
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="seconds per request"
+    )
+    parser.add_argument("--max-page-size", type=int, default=50)
+    parser.add_argument(
+        "--without-transaction-ids",
+        action="store_true",
+        help="leaves ClientId and ProjectId out of the transactions",
+    )
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--projects-per-client", type=int, default=5)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--entries-per-day", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", action="append", help="scenario to run, repeatable")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare to")
+    parser.add_argument("--save-baseline", help="saves this run to a JSON file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    arguments = parser.parse_args()
+
+    server = start_server(
+        latency=arguments.latency,
+        max_page_size=arguments.max_page_size,
+        transaction_ids=not arguments.without_transaction_ids,
+        clients=arguments.clients,
+        projects_per_client=arguments.projects_per_client,
+        days=arguments.days,
+        entries_per_day=arguments.entries_per_day,
+    )
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        dataset = server.dataset
+        write_config(directory, server, dataset)
+        environment = {**os.environ, "XDG_CONFIG_HOME": directory, "HOME": directory}
+        apply_file = write_apply_file(directory, dataset)
+        scenarios = get_scenarios(apply_file, dataset)
+        print(
+            f"{'command':32} {'wall (s)':>9} {'requests':>9} {'conns':>6} "
+            f"{'sent (B)':>10} {'recv (B)':>10}"
+        )
+        for name, scenario in scenarios.items():
+            if arguments.only and name not in arguments.only:
+                continue
+            runs = [
+                run_scenario(server, environment, *scenario)
+                for _ in range(arguments.repeat)
+            ]
+            result = {
+                key: statistics.median(run[key] for run in runs) for key in runs[0]
+            }
+            results[name] = result
+            print(
+                f"{name:32} {result['wall']:9.3f} {result['requests']:9.0f} "
+                f"{result['connections']:6.0f} {result['bytes_sent']:10.0f} "
+                f"{result['bytes_received']:10.0f}"
+            )
+    server.shutdown()
+
+    if arguments.save_baseline:
+        with open(arguments.save_baseline, "w") as file_writer:
+            file_writer.write(json.dumps(results, indent=2))
+    if arguments.baseline:
+        with open(arguments.baseline, "r") as file_reader:
+            failures = compare(
+                results, json.loads(file_reader.read()), arguments.tolerance
+            )
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Startup benchmark of the abak CLI, based on python -X importtime
+
+Checks that importing fancy_abak.abak stays under the budget and that --help and shell
+completion don't import the heavy third-party modules only needed to run commands.
+
+Usage (from the root of the repository):
+    python -m benchmarks.bench_startup [--budget-ms 100] [--repeat 5]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# Target budget for the cumulative import time of fancy_abak.abak, in milliseconds
+IMPORT_BUDGET_MS = 100
+HEAVY_MODULES = ["requests", "keyring", "yaml", "tabulate", "pyfzf", "webbrowser"]
+
+SCENARIOS = {
+    "import": ([], {}),
+    "--help": (["--help"], {}),
+    "config --help": (["config", "--help"], {}),
+    "complete 'config remove -k'": (
+        [],
+        {
+            "_ABAK_COMPLETE": "bash_complete",
+            "COMP_WORDS": "abak config remove -k ",
+            "COMP_CWORD": "4",
+        },
+    ),
+}
+
+
+def run_scenario(arguments, environment, config_home):
+    code = (
+        "import sys\n"
+        "from fancy_abak.abak import abak\n"
+        f"if {bool(arguments or environment)}:\n"
+        f"    abak({arguments!r}, prog_name='abak')\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env={**os.environ, "XDG_CONFIG_HOME": config_home, **environment},
+        capture_output=True,
+        text=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def parse_importtime(output):
+    """
+    Returns:
+        dict: {module: (self time, cumulative time)} in milliseconds
+    """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = (int(self_time) / 1000, int(cumulative) / 1000)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    arguments = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as config_home:
+        for scenario, (command, environment) in SCENARIOS.items():
+            runs = [
+                run_scenario(command, environment, config_home)
+                for _ in range(arguments.repeat)
+            ]
+            best = min(runs, key=lambda modules: modules["fancy_abak.abak"][1])
+            total = best["fancy_abak.abak"][1]
+            print(f"{scenario}: fancy_abak.abak imported in {total:.1f}ms")
+
+            heavy = [module for module in HEAVY_MODULES if module in best]
+            if heavy:
+                failures.append(f"{scenario} imported {', '.join(heavy)}")
+            if scenario == "import":
+                if total > arguments.budget_ms:
+                    failures.append(
+                        f"import took {total:.1f}ms, budget is {arguments.budget_ms}ms"
+                    )
+                print("  slowest modules (self time):")
+                for name, (self_time, cumulative) in sorted(
+                    best.items(), key=lambda item: item[1][0], reverse=True
+                )[: arguments.top]:
+                    print(f"  {self_time:8.2f}ms {cumulative:8.2f}ms  {name}")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""
+Local stand-in for the Abak endpoints used by the CLI, to benchmark it without a real tenant
+
+Responses use the same shapes as Abak, including the javascript "new Date(...)" literals,
+over a generated dataset. Every request can be delayed to simulate the network and the
+server counts the requests, bytes and connections it served:
+    GET  /__stats  returns the counters as JSON
+    POST /__reset  clears the counters, and regenerates the dataset with ?data=1
+
+Usage (from the root of the repository):
+    python -m benchmarks.mock_abak_server [--port 8080] [--latency 0.05] [--clients 20]
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+EMPLOYEE_ID = "EMP1"
+USERNAME = "bench"
+TOKEN = f"AbakUsername={USERNAME}; AbakDateFormat={{Y-M-d}}; path=/"
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%m/%d/%y", "%d-%m-%Y"]
+JSON_DATE = re.compile(r'"new Date\(([-\d, ]+)\)"')
+SESSION_PATTERN = re.compile(r"AbakSession=(\d+)")
+
+
+def abak_date(day):
+    # Abak months start at 0, like javascript
+    return f"new Date({day.year},{day.month - 1},{day.day})"
+
+
+def parse_date(value):
+    value = (value or "").split("T")[0]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date {value!r}")
+
+
+def date_range(day, query_range):
+    if query_range == "Daily":
+        return day, day
+    if query_range == "Monthly":
+        first = day.replace(day=1)
+        following = (first + timedelta(days=32)).replace(day=1)
+        return first, following - timedelta(days=1)
+    # Abak weeks start on Sunday
+    first = day - timedelta(days=(day.weekday() + 1) % 7)
+    return first, first + timedelta(days=6)
+
+
+def generate_dataset(
+    clients=20, projects_per_client=5, days=90, entries_per_day=3, employees=1, seed=42
+):
+    """
+    Generates the clients, projects and timesheet entries of the employees, the first
+    one being the logged in employee
+
+    Args:
+        clients (int): number of clients
+        projects_per_client (int): number of projects of each client
+        days (int): number of days, up to today, with timesheet entries
+        entries_per_day (int): timesheet entries on each weekday
+        employees (int): number of employees with timesheet entries
+
+    Returns:
+        dict: {"clients": list, "projects": list, "employees": list,
+            "transactions": dict by Id}
+    """
+    generator = random.Random(seed)
+    client_rows = [
+        {"Id": f"C{index}", "DisplayName": f"Client {index}", "Code": f"C{index}"}
+        for index in range(clients)
+    ]
+    project_rows = [
+        {
+            "Id": f"P{index}-{number}",
+            "ClientId": client["Id"],
+            "Display": f"Project {number} of {client['DisplayName']}",
+        }
+        for index, client in enumerate(client_rows)
+        for number in range(projects_per_client)
+    ]
+    employee_ids = [EMPLOYEE_ID] + [f"EMP{index + 1}" for index in range(1, employees)]
+    transactions = {}
+    today = date.today()
+    for employee_id in employee_ids:
+        for offset in range(days):
+            day = today - timedelta(days=offset)
+            if day.weekday() > 4:
+                continue
+            for number in range(entries_per_day):
+                project = generator.choice(project_rows)
+                transaction_id = f"T{len(transactions) + 1}"
+                transactions[transaction_id] = {
+                    "Id": transaction_id,
+                    "TransactType": "T",
+                    "EmployeeId": employee_id,
+                    "Date": day,
+                    "ClientId": project["ClientId"],
+                    "ProjectId": project["Id"],
+                    "ProjectName": project["Display"],
+                    "Description": f"Task {number} of {day.isoformat()}",
+                    "Quantity": generator.choice([1, 2, 2.5, 4, 8]),
+                    # Every tenth entry is internal work that isn't billed
+                    "IsBillable": (len(transactions) + 1) % 10 != 0,
+                    "IsApproved": False,
+                }
+    return {
+        "clients": client_rows,
+        "projects": project_rows,
+        "employees": employee_ids,
+        "transactions": transactions,
+    }
+
+
+class MockAbakServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        latency=0,
+        jitter=0,
+        max_page_size=50,
+        transaction_ids=True,
+        token_ttl=0,
+        **dataset,
+    ):
+        super().__init__(address, MockAbakHandler)
+        # Without the ids, transactions can only be matched to projects by name
+        self.transaction_ids = transaction_ids
+        self.latency = latency
+        self.jitter = jitter
+        self.max_page_size = max_page_size
+        # With a ttl, each login opens a session that expires, like the cookies of Abak
+        self.token_ttl = token_ttl
+        self.sessions = {}
+        self.dataset_options = dataset
+        self.lock = threading.Lock()
+        self.dataset = generate_dataset(**dataset)
+        self.reset_stats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self, data=False):
+        with self.lock:
+            self.stats = {
+                "requests": 0,
+                "connections": 0,
+                "bytes_received": 0,
+                "bytes_sent": 0,
+                "paths": {},
+            }
+            if data:
+                self.dataset = generate_dataset(**self.dataset_options)
+
+    def login(self):
+        """
+        Returns:
+            str: the Set-Cookie header of a login, as requests joins the cookies
+        """
+        if not self.token_ttl:
+            return TOKEN
+        with self.lock:
+            session = len(self.sessions) + 1
+            self.sessions[session] = time.time() + self.token_ttl
+        expires = formatdate(self.sessions[session], usegmt=True)
+        return f"AbakSession={session}; expires={expires}; path=/, {TOKEN}"
+
+    def is_authorized(self, cookie):
+        if "AbakUsername" not in cookie:
+            return False
+        if not self.token_ttl:
+            return True
+        session = SESSION_PATTERN.search(cookie)
+        with self.lock:
+            expires_at = self.sessions.get(int(session.group(1))) if session else None
+        return expires_at is not None and time.time() < expires_at
+
+    def record(self, path, received, sent):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_received"] += received
+            self.stats["bytes_sent"] += sent
+            self.stats["paths"][path] = self.stats["paths"].get(path, 0) + 1
+
+
+class MockAbakHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def read_body(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        text = raw.decode()
+        if "json" in (self.headers.get("Content-Type") or ""):
+            return raw, json.loads(text or "{}")
+        query = parse_qs(urlsplit(self.path).query)
+        query.update(parse_qs(text, keep_blank_values=True))
+        return raw, {key: values[-1] for key, values in query.items()}
+
+    def handle_request(self):
+        raw, body = self.read_body()
+        path = urlsplit(self.path).path
+        if path == "/__stats":
+            with self.server.lock:
+                return self.send(200, json.dumps(self.server.stats))
+        if path == "/__reset":
+            self.server.reset_stats("data=1" in self.path)
+            return self.send(200, "{}")
+
+        if not getattr(self, "counted", False):
+            # Only the connections of the CLI are counted, not those of /__stats
+            self.counted = True
+            with self.server.lock:
+                self.server.stats["connections"] += 1
+        if self.server.latency or self.server.jitter:
+            time.sleep(self.server.latency + random.uniform(0, self.server.jitter))
+        headers = {}
+        if path == "/Abak/Account/Authenticate":
+            status, payload = 200, {"success": True}
+            headers["Set-Cookie"] = self.server.login()
+        elif path == "/login":
+            status, payload = 200, {"access_token": "bench"}
+        elif not self.server.is_authorized(self.headers.get("Cookie") or ""):
+            status, payload = 401, "<html><title>Unauthorized</title></html>"
+        else:
+            handler = ROUTES.get(path)
+            if handler is None:
+                status, payload = 404, "<html><title>Not Found</title></html>"
+            else:
+                with self.server.lock:
+                    status, payload = 200, handler(self.server, body)
+
+        text = (
+            payload
+            if isinstance(payload, str)
+            else JSON_DATE.sub(
+                r"new Date(\1)", json.dumps(payload, default=abak_date_json)
+            )
+        )
+        sent = self.send(status, text, headers)
+        request_size = len(self.requestline) + len(str(self.headers)) + len(raw)
+        self.server.record(path, request_size, sent)
+
+    def send(self, status, text, headers={}):
+        content = text.encode()
+        self.send_response(status)
+        content_type = "text/html" if text.startswith("<") else "application/json"
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+        return len(content)
+
+
+def abak_date_json(value):
+    if isinstance(value, date):
+        return abak_date(value)
+    raise TypeError(value)
+
+
+def page(server, rows, body):
+    start = int(body.get("start") or 0)
+    limit = min(int(body.get("limit") or server.max_page_size), server.max_page_size)
+    return {"success": True, "data": rows[start : start + limit], "total": len(rows)}
+
+
+def matches(row, query_text, key):
+    return not query_text or query_text.lower() in row[key].lower()
+
+
+def get_employee(server, body):
+    return {"success": True, "data": [{"Id": EMPLOYEE_ID, "Username": USERNAME}]}
+
+
+def get_clients(server, body):
+    rows = [
+        row
+        for row in server.dataset["clients"]
+        if matches(row, body.get("queryText"), "DisplayName")
+    ]
+    return page(server, rows, body)
+
+
+def get_projects(server, body):
+    rows = [
+        row
+        for row in server.dataset["projects"]
+        if (not body.get("clientId") or row["ClientId"] == body["clientId"])
+        and matches(row, body.get("queryText"), "Display")
+    ]
+    return page(server, rows, body)
+
+
+def transactions_between(server, first, last, employee_id=EMPLOYEE_ID):
+    return sorted(
+        (
+            row
+            for row in server.dataset["transactions"].values()
+            if first <= row["Date"] <= last and row["EmployeeId"] == employee_id
+        ),
+        key=lambda row: (row["Date"], row["Id"]),
+    )
+
+
+def get_grouped_transacts(server, body):
+    first, last = date_range(parse_date(body["date"]), body.get("range", "Weekly"))
+    rows = transactions_between(server, first, last, body.get("employe"))
+    if not server.transaction_ids:
+        rows = [
+            {key: row[key] for key in row if key not in ["ClientId", "ProjectId"]}
+            for row in rows
+        ]
+    return {"success": True, "data": rows, "total": len(rows)}
+
+
+def edit_timesheet(server, body):
+    transactions = server.dataset["transactions"]
+    transaction_id = body.get("fieldId") or f"T{len(transactions) + 1}"
+    project = next(
+        (
+            row
+            for row in server.dataset["projects"]
+            if row["Id"] == body.get("fieldProjectId_Value")
+        ),
+        {"Display": body.get("fieldProjectId_Value")},
+    )
+    transactions[transaction_id] = {
+        "Id": transaction_id,
+        "TransactType": "T",
+        "EmployeeId": body.get("fieldEmployeeId"),
+        "Date": parse_date(body.get("fieldDate")),
+        "ClientId": body.get("fieldClientId_Value"),
+        "ProjectId": body.get("fieldProjectId_Value"),
+        "ProjectName": project["Display"],
+        "Description": body.get("fieldDescription"),
+        "Quantity": float(body.get("fieldQuantity", "0").split()[0]),
+        "IsBillable": body.get("fieldIsBillable") == "fieldIsBillable",
+        "IsApproved": False,
+    }
+    return {"success": True, "extraParams": {"newID": transaction_id}}
+
+
+def delete_transacts(server, body):
+    for transact in body.get("transacts", []):
+        server.dataset["transactions"].pop(transact["key"], None)
+    return {"success": True}
+
+
+def get_approvals(server, body):
+    rows = transactions_between(
+        server,
+        parse_date(body["startDate"]),
+        parse_date(body["endDate"]),
+        body.get("employeeId"),
+    )
+    return page(server, rows, body)
+
+
+def set_approval(approved):
+    def approve(server, body):
+        if body.get("employeeId") not in server.dataset["employees"]:
+            return {"success": False, "message": "Unknown employee"}
+        for row in transactions_between(
+            server,
+            parse_date(body["startDate"]),
+            parse_date(body["endDate"]),
+            body["employeeId"],
+        ):
+            row["IsApproved"] = approved
+        return {"success": True}
+
+    return approve
+
+
+ROUTES = {
+    "/Abak/Transact/GetEmployee_Optimized": get_employee,
+    "/Abak/Common/GetTimesheetClientsPaginated": get_clients,
+    "/Abak/Common/GetTimesheetProjectsForPaginatedCombo": get_projects,
+    "/Abak/Transact/GetGroupedTransacts": get_grouped_transacts,
+    "/Abak/Timesheet/Edit": edit_timesheet,
+    "/Abak/Transact/DeleteTransacts": delete_transacts,
+    "/Abak/Approval/GetApprovalsList": get_approvals,
+    "/Abak/Approval/ApproveRangeFromApprobation": set_approval(True),
+    "/Abak/Approval/UnapproveRange": set_approval(False),
+}
+
+
+def start_server(host="127.0.0.1", port=0, **options):
+    """
+    Starts the mock server on a background thread
+
+    Args:
+        port (int): port to listen on, 0 picks a free one
+        **options: latency, jitter, max_page_size, token_ttl and the arguments of
+            generate_dataset
+
+    Returns:
+        MockAbakServer: the running server, stopped with server.shutdown()
+    """
+    server = MockAbakServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0, help="random extra seconds")
+    parser.add_argument("--max-page-size", type=int, default=50)
+    parser.add_argument(
+        "--token-ttl",
+        type=float,
+        default=0,
+        help="seconds before the cookie of a login expires, 0 never",
+    )
+    parser.add_argument(
+        "--without-transaction-ids",
+        action="store_true",
+        help="leaves ClientId and ProjectId out of the transactions",
+    )
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--projects-per-client", type=int, default=5)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--entries-per-day", type=int, default=3)
+    parser.add_argument("--employees", type=int, default=1)
+    arguments = parser.parse_args()
+
+    server = MockAbakServer(
+        (arguments.host, arguments.port),
+        latency=arguments.latency,
+        jitter=arguments.jitter,
+        max_page_size=arguments.max_page_size,
+        token_ttl=arguments.token_ttl,
+        transaction_ids=not arguments.without_transaction_ids,
+        clients=arguments.clients,
+        projects_per_client=arguments.projects_per_client,
+        days=arguments.days,
+        entries_per_day=arguments.entries_per_day,
+        employees=arguments.employees,
+    )
+    print(f"Mock Abak listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,145 @@
-import webbrowser
 import click
-from fancy_abak import timesheets, client, project, abak_config
-from fancy_abak.abak_context import context
-from fancy_abak.do import do
-import fancy_abak.abak_config
 import os
-import keyring
 
-from requests.exceptions import ConnectionError
+from fancy_abak.lazy_group import LazyGroup
+from fancy_abak.abak_shared_functions import get_config, authenticate, Sorry
 
-from fancy_abak.abak_shared_functions import (
-    write_config_file,
-    get_config,
-    authenticate,
-    httprequest,
-    Sorry,
-)
+# Subcommands are only imported when invoked, so that --help and completion stay fast
+SUBCOMMANDS = {
+    "client": (
+        "fancy_abak.client:client",
+        "Find clients to assign timesheet entries",
+    ),
+    "config": (
+        "fancy_abak.abak_config:config",
+        "Group of commands to manage the jiractl command line",
+    ),
+    "context": ("fancy_abak.abak_context:context", "Context operations for Abak."),
+    "daemon": (
+        "fancy_abak.daemon:daemon",
+        "Keeps abak running in the background to answer the read-only commands",
+    ),
+    "do": ("fancy_abak.do:do", 'GPT Powered command to "do" something'),
+    "project": (
+        "fancy_abak.project:project",
+        "Find projects to assign timesheet entries",
+    ),
+    "shell": (
+        "fancy_abak.shell:shell",
+        "Runs abak commands in a session that stays open",
+    ),
+    "timesheet": (
+        "fancy_abak.timesheets:timesheet",
+        "Commands to manage timesheet entries",
+    ),
+}
+
+
+def echo_connection_stats():
+    from fancy_abak.abak_shared_functions import get_connection_stats
+
+    for endpoint, stats in get_connection_stats().items():
+        click.echo(
+            f"{endpoint}: {stats['requests']} requests, "
+            f"{stats['opened']} connections opened, {stats['reused']} reused",
+            err=True,
+        )
+
+
+def start_profiling(ctx, param, value):
+    # Eager, so that importing the subcommand is profiled too
+    if value:
+        from fancy_abak.abak_shared_functions.profiling import enable_profiling
+
+        enable_profiling()
+    return value
+
+
+def echo_profile(trace_file):
+    from fancy_abak.abak_shared_functions.profiling import (
+        get_events,
+        format_profile,
+        profile_elapsed,
+        write_chrome_trace,
+    )
+
+    elapsed = profile_elapsed()
+    events = get_events()
+    click.echo(format_profile(events, elapsed), err=True)
+    if trace_file:
+        write_chrome_trace(trace_file, events)
+        click.echo(f"Trace written to {trace_file}", err=True)
 
 
-@click.group()
+@click.group(cls=LazyGroup, lazy_subcommands=SUBCOMMANDS)
+@click.option(
+    "--connection-stats",
+    help="Shows how many connections were opened and reused when the command ends",
+    is_flag=True,
+)
+@click.option(
+    "--profile",
+    help="Shows where the time of the command went when it ends",
+    is_flag=True,
+    is_eager=True,
+    callback=start_profiling,
+)
+@click.option(
+    "--profile-trace",
+    help="Also writes the profile to a Chrome trace file, for chrome://tracing",
+    type=click.Path(dir_okay=False, writable=True),
+    is_eager=True,
+    callback=start_profiling,
+)
 @click.pass_context
-def abak(ctx):
+def abak(ctx, connection_stats, profile, profile_trace):
     """
     Abak UI, NEVER AGAIN!
     """
+    if connection_stats:
+        ctx.call_on_close(echo_connection_stats)
+    if profile or profile_trace:
+        ctx.call_on_close(lambda: echo_profile(profile_trace))
     config = get_config()
     if ctx.invoked_subcommand not in ["login", "config"]:
+        from fancy_abak.abak_shared_functions import validate_identity, Unreachable
+        from fancy_abak.abak_shared_functions.token_manager import refresh_token
+
         try:
-            result = httprequest("get", None, "/Abak/Transact/GetEmployee_Optimized")
-            config["user_id"] = result["data"][0]["Id"]
-            write_config_file(config["config_file_path"], config)
-            for key in config:
-                if config.get(key) and key not in [
-                    "app_dir",
-                    "config_file_path",
-                    "authenticated",
-                    "headers",
-                    "token",
-                    "contexts",
-                ]:
-                    os.environ.setdefault(key, config.get(key))
-        except ConnectionError:
-            Sorry(
-                "it seems that you are not connected to the internet or the endpoint is not available"
-            )
-        except Exception as exc:
-            try:
-                authenticate(
-                    config["username"],
-                    keyring.get_password("fancy-abak", config["username"]),
-                    config["endpoint"],
+            validate_identity(config)
+        except Unreachable:
+            # With a known identity, the commands that work offline, like the ones
+            # queuing their writes, still run, the others raise Unreachable themselves
+            if not config.get("user_id"):
+                raise Sorry(
+                    "it seems that you are not connected to the internet or the endpoint is not available"
                 )
-            except KeyError:
+        except Exception:
+            if not config.get("username"):
                 click.echo("Please login first!")
                 exit(127)
-            except Exception as exception:
-                raise exception
+            # Logs in once for all the abak processes running, then asks again
+            config = refresh_token(config.get("token"))
+            validate_identity(config)
+        for key in config:
+            if config.get(key) and key not in [
+                "app_dir",
+                "config_file_path",
+                "authenticated",
+                "headers",
+                "token",
+                "token_issued_at",
+                "token_expires_at",
+                "contexts",
+                "user_id_validated_at",
+                "transaction_project_ids",
+            ]:
+                os.environ.setdefault(key, config.get(key))
 
 
 def get_password(ctx, param, value):
+    import keyring
+
     if not value:
         return keyring.get_password("fancy-abak", ctx.params["username"])
     else:
@@ -92,6 +173,8 @@ def login(username, password, endpoint):
 
 @click.command(name="open")
 def open_browser():
+    import webbrowser
+
     config = get_config()
     webbrowser.open(config["endpoint"])
 
@@ -99,13 +182,6 @@ def open_browser():
 abak.add_command(login)
 abak.add_command(open_browser)
 
-abak.add_command(timesheets.timesheet)
-abak.add_command(client.client)
-abak.add_command(project.project)
-abak.add_command(abak_config.config)
-abak.add_command(context)
-abak.add_command(do)
-
 
 if __name__ == "__main__":
     abak()
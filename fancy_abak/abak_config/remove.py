@@ -1,5 +1,5 @@
 import click
-from fancy_abak.abak_shared_functions import write_config_file, get_config
+from fancy_abak.abak_shared_functions import update_config, get_config
 
 
 def get_keys(ctx, args, incomplete):
@@ -28,7 +28,4 @@ def remove_config(ctx, key):
 
 
 def remove_configuration_key(key):
-    configuration = get_config()
-    if configuration.get(key):
-        del configuration[key]
-    write_config_file(configuration["config_file_path"], configuration)
+    update_config(removed_keys=[key])
@@ -1,5 +1,5 @@
 import click
-from fancy_abak.abak_shared_functions import get_config, write_config_file
+from fancy_abak.abak_shared_functions import update_config
 
 
 @click.command(name="set")
@@ -22,6 +22,4 @@ def set_config(ctx, key, value):
 
 
 def set_configuration_key(value, key):
-    configuration = get_config()
-    configuration[key] = value
-    write_config_file(configuration["config_file_path"], configuration)
+    update_config({key: value})
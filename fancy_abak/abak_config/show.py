@@ -1,6 +1,5 @@
 import click
 import json
-import yaml
 from fancy_abak.abak_shared_functions import get_clean_config
 
 
@@ -26,6 +25,8 @@ def show_config(ctx, key, output):
         if output == "json":
             click.echo(json.dumps(configuration))
         elif output == "yaml":
+            import yaml
+
             click.echo(yaml.dump(configuration))
     elif configuration.get(key):
         click.echo(configuration[key])
@@ -1,10 +1,7 @@
 import click
-import yaml
 import json
-from tabulate import tabulate
 from fancy_abak.abak_config import set_configuration_key
 from fancy_abak.abak_shared_functions import get_clean_config, Sorry
-from pyfzf import FzfPrompt
 from os import environ
 
 headers = ["Project", "Client", "Price"]
@@ -34,12 +31,16 @@ def context_list(output):
     if len(contexts) == 0:
         raise Sorry("there are no contexts created")
     if output == "table":
+        from tabulate import tabulate
+
         rows = [
             [context] + [contexts[context].get(header, 0) for header in headers]
             for context in contexts
         ]
         click.echo(tabulate(rows, headers=["Context"] + headers))
     elif output in ["yaml", "yml"]:
+        import yaml
+
         click.echo(yaml.dump(contexts))
     elif output == "json":
         click.echo(json.dumps(contexts))
@@ -92,6 +93,8 @@ def context_select(name):
     """
     contexts = get_contexts()
     if not name:
+        from pyfzf import FzfPrompt
+
         fzf = FzfPrompt()
         selected_context = fzf.prompt(
             [context for context in contexts], fzf_options="+m"
@@ -153,8 +156,12 @@ def context_price(ctx):
     prompt="Price of the hour",
     required=True,
 )
+@click.option(
+    "--tier",
+    help="Sets the price of a tier, like overtime, instead of the price of the context",
+)
 @click.pass_context
-def context_price_set(ctx, context, price):
+def context_price_set(ctx, context, price, tier):
     """
     Sets the price of the hour in a context
     """
@@ -168,7 +175,10 @@ def context_price_set(ctx, context, price):
         raise Sorry(f"context {context} not found")
 
     try:
-        selected_context["Price"] = float(price)
+        if tier:
+            selected_context.setdefault("Tiers", {})[tier] = float(price)
+        else:
+            selected_context["Price"] = float(price)
     except:
         raise Sorry(f"can't convert {price} to a float number")
 
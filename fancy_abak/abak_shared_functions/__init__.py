@@ -1,5 +1,35 @@
+import importlib
+
+from .profiling import span, add_request_hook, remove_request_hook
 from .abak_configuration_functions import *
+from .config_store import ConfigStore, get_config_store
 from .exceptions import *
 from .option_check import *
 from .bsgenerator import generate_bs
-from .requests_functions import httprequest, fancy_abak_request
+from .catalog_cache import get_catalog, filter_catalog, is_catalog_fresh
+from .bulk_functions import run_bulk, summarize, format_summary, error_message
+from .renderers import render, OUTPUT_FORMATS
+
+# These modules import requests, they are only loaded when one of their names is used
+# so that --help and shell completion don't pay for it
+LAZY_ATTRIBUTES = {
+    "httprequest": ".requests_functions",
+    "fancy_abak_request": ".requests_functions",
+    "paginate": ".requests_functions",
+    "validate_identity": ".requests_functions",
+    "convert_date": ".requests_functions",
+    "parse_abak_json": ".requests_functions",
+    "get_connection_stats": ".session_functions",
+    "close_sessions": ".session_functions",
+    "async_httprequest": ".async_requests_functions",
+    "async_fancy_abak_request": ".async_requests_functions",
+    "gather_requests": ".async_requests_functions",
+    "run_in_thread": ".async_requests_functions",
+    "run_concurrently": ".async_requests_functions",
+}
+
+
+def __getattr__(name):
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(LAZY_ATTRIBUTES[name], __name__), name)
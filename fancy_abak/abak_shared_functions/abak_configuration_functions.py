@@ -1,30 +1,41 @@
 import click
 import os
 import json
-import requests
 import re
+import time
+from .exceptions import Sorry
+from .config_store import get_config_store
+from .profiling import span
 
 
 def get_headers(config):
     return {}
 
 
-def get_config():
+RUNTIME_KEYS = ["headers", "app_dir", "config_file_path", "authenticated"]
+
+
+def get_config_file_path():
     app_name = ".abakctl"
     config_file = "config.json"
     app_dir = click.get_app_dir(app_name)
-    config_file_path = os.path.join(app_dir, config_file)
+    return os.path.join(app_dir, config_file)
+
+
+def get_config():
+    config_file_path = get_config_file_path()
     config = read_configfile(config_file_path)
     config["authenticated"] = True
     config["headers"] = get_headers(config)
-    config["app_dir"] = app_dir
+    config["app_dir"] = os.path.dirname(config_file_path)
     config["config_file_path"] = config_file_path
     return config
 
 
 def read_configfile(config_file_path: str) -> dict:
     """
-    This function reads the contents of the config file for jiractl and dumps it as a dict for later use
+    This function reads the contents of the config file for jiractl and dumps it as a dict for later use.
+    The file is only parsed once per process, unless another process changes it.
 
     Args:
         config_file_path (string): path of the config file
@@ -32,50 +43,75 @@ def read_configfile(config_file_path: str) -> dict:
     Returns:
         dict: dictionary with the configuration to run jiractl
     """
-    if not os.path.isfile(config_file_path):
-        create_default_configfile()
-    with open(config_file_path, "r") as file_reader:
-        config_dict = json.loads(file_reader.read())
-    return config_dict
+    with span("config"):
+        if not os.path.isfile(config_file_path):
+            create_default_configfile()
+        return get_config_store(config_file_path).to_dict()
 
 
 def create_default_configfile():
-    app_name = ".abakctl"
-    config_file = "config.json"
-    app_dir = click.get_app_dir(app_name)
-    dir_split = app_dir.split("/")
-    for i in range(2, len(dir_split) + 1, 1):
-        current_path = "/".join(dir_split[:i])
-        print(current_path)
-        if not os.path.isdir(current_path):
-            os.mkdir(current_path)
-    config = {}
-    write_config_file(os.path.join(app_dir, config_file), config)
+    config_file_path = get_config_file_path()
+    os.makedirs(os.path.dirname(config_file_path), exist_ok=True)
+    if not os.path.isfile(config_file_path):
+        with open(config_file_path, "w") as file_writer:
+            file_writer.write(json.dumps({}))
 
 
 def write_config_file(file_path, data):
-    if data.get("headers"):
-        del data["headers"]
-    if data.get("app_dir"):
-        del data["app_dir"]
-    if data.get("config_file_path"):
-        del data["config_file_path"]
-    if data.get("authenticated"):
-        del data["authenticated"]
-    with open(file_path, "w") as file_writer:
-        file_writer.write(json.dumps(data))
+    """
+    Makes the config file match data, only writing it when something changed
+
+    Args:
+        file_path (str): path of the config file
+        data (dict): the whole configuration
+    """
+    store = get_config_store(file_path)
+    store.replace({key: data[key] for key in data if key not in RUNTIME_KEYS})
+    store.save()
+
+
+def update_config(values={}, removed_keys=[]):
+    """
+    Changes only the given keys of the config file, keeping the changes other processes made to the rest
+
+    Args:
+        values (dict): keys to set
+        removed_keys (list): keys to remove
+
+    Returns:
+        bool: True if the file was written
+    """
+    store = get_config_store(get_config_file_path())
+    store.update(values)
+    for key in removed_keys:
+        store.remove(key)
+    return store.save()
 
 
 def authenticate(username, password, endpoint):
+    from .session_functions import session_request
+    from .token_manager import parse_cookie_expiry
+
     config = get_config()
     body = {"username": username, "password": password, "device": "W"}
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    result = requests.post(
-        endpoint + "/Abak/Account/Authenticate", data=body, headers=headers
+    result = session_request(
+        config,
+        "POST",
+        endpoint + "/Abak/Account/Authenticate",
+        data=body,
+        headers=headers,
     )
     result.raise_for_status()
     if result.headers["Set-Cookie"].find("AbakUsername") > 0:
+        removed_keys = []
+        if config.get("username") != username or config.get("endpoint") != endpoint:
+            removed_keys = ["user_id", "user_id_validated_at"]
         config["token"] = result.headers["Set-Cookie"]
+        config["token_issued_at"] = time.time()
+        config["token_expires_at"] = parse_cookie_expiry(
+            result.headers["Set-Cookie"], config["token_issued_at"]
+        )
         config["endpoint"] = endpoint
         config["username"] = username
         config["fancy_abak_endpoint"] = "https://abak.fancywhale.ca"
@@ -88,17 +124,51 @@ def authenticate(username, password, endpoint):
         if not config.get("date_format"):
             config["date_format"] = "%Y-%m-%d"
         # Now getting the fancy-abak token
-        result = requests.post(
+        result = session_request(
+            config,
+            "POST",
             config["fancy_abak_endpoint"] + "/login",
             data={"username": username, "password": password},
         )
         config["access_token"] = f"Bearer {result.json()['access_token']}"
-        write_config_file(config["config_file_path"], config)
+        update_config(
+            {
+                key: config[key]
+                for key in [
+                    "token",
+                    "token_issued_at",
+                    "token_expires_at",
+                    "endpoint",
+                    "username",
+                    "fancy_abak_endpoint",
+                    "abak_date_format",
+                    "date_format",
+                    "access_token",
+                ]
+            },
+            removed_keys,
+        )
     else:
         click.echo(result.json()["errorMessage"])
         exit(10)
 
 
+def reauthenticate():
+    """
+    Authenticates again with the username, endpoint and keyring password of the last login
+    """
+    import keyring
+
+    config = get_config()
+    if not config.get("username") or not config.get("endpoint"):
+        raise Sorry("you need to login first with 'abak login'")
+    authenticate(
+        config["username"],
+        keyring.get_password("fancy-abak", config["username"]),
+        config["endpoint"],
+    )
+
+
 def get_clean_config():
     configuration = get_config()
     configuration["token"] = "**********"
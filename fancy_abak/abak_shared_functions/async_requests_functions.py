@@ -0,0 +1,88 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .abak_configuration_functions import get_config
+from .requests_functions import httprequest, fancy_abak_request
+from .session_functions import DEFAULT_POOL_SIZE, _get_setting
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the threads the async requests run on, one per connection of the pool so
+    that gathered requests never wait for a free connection
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_get_setting(
+                    get_config(), "pool_size", DEFAULT_POOL_SIZE, int
+                ),
+                thread_name_prefix="abak-request",
+            )
+    return _executor
+
+
+async def run_in_thread(function, *args, **kwargs):
+    """
+    Runs a blocking function, like get_projects, without blocking the event loop
+
+    Returns:
+        the value returned by the function
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(function, *args, **kwargs)
+    )
+
+
+async def async_httprequest(request_type, body, path, is_json=False, headers={}):
+    """
+    Awaitable version of httprequest, with the same cookie authentication, date
+    conversion and errors, sent through the same pooled session
+    """
+    return await run_in_thread(
+        httprequest, request_type, body, path, is_json, dict(headers)
+    )
+
+
+async def async_fancy_abak_request(request_type, body, path, is_json, headers={}):
+    """
+    Awaitable version of fancy_abak_request
+    """
+    return await run_in_thread(
+        fancy_abak_request, request_type, body, path, is_json, dict(headers)
+    )
+
+
+async def gather_requests(*requests, return_exceptions=False):
+    """
+    Waits for independent requests sent at the same time, the wall time is the one of the
+    slowest
+
+    Args:
+        *requests: awaitables, like async_httprequest(...) or run_in_thread(...)
+        return_exceptions (bool): returns the exceptions instead of raising the first one
+
+    Returns:
+        list: the results in the order of the requests
+    """
+    return await asyncio.gather(*requests, return_exceptions=return_exceptions)
+
+
+def run_concurrently(*calls):
+    """
+    Runs blocking calls at the same time from synchronous code, like a click command
+
+    Args:
+        *calls: (function, arg, ...) tuples
+
+    Returns:
+        list: the results in the order of the calls
+    """
+    return asyncio.run(gather_requests(*[run_in_thread(*call) for call in calls]))
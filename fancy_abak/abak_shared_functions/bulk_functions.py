@@ -0,0 +1,107 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from click import ClickException
+
+
+class RateLimiter:
+    """
+    Spaces the start of the operations so that no more than `rate` start per second
+
+    Args:
+        rate (float): operations per second, 0 means unlimited
+    """
+
+    def __init__(self, rate=0):
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_start = 0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next_start, now)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def error_message(error):
+    if isinstance(error, ClickException):
+        return error.format_message()
+    return str(error) or error.__class__.__name__
+
+
+def run_bulk(items, worker, concurrency=4, rate_limit=0):
+    """
+    Runs worker(item) for every item on a bounded pool of threads, collecting the
+    result or the error of each one instead of stopping on the first failure
+
+    Args:
+        items (list): the items to process
+        worker (function): function called with each item
+        concurrency (int): maximum number of items processed at the same time
+        rate_limit (float): maximum number of items started per second, 0 means unlimited
+
+    Returns:
+        tuple: (results, summary) where results is a list of dicts with the keys
+            "item", "result", "error" and "latency", in the same order as items
+    """
+    limiter = RateLimiter(rate_limit)
+
+    def run(item):
+        limiter.wait()
+        started = time.perf_counter()
+        try:
+            output = {"item": item, "result": worker(item), "error": None}
+        except Exception as error:
+            output = {"item": item, "result": None, "error": error_message(error)}
+        output["latency"] = time.perf_counter() - started
+        return output
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(int(concurrency), 1)) as executor:
+        results = list(executor.map(run, items))
+    return results, summarize(results, time.perf_counter() - started)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(results, elapsed):
+    """
+    Args:
+        results (list): results returned by run_bulk
+        elapsed (float): wall time of the whole run, in seconds
+
+    Returns:
+        dict: counts, throughput (items per second) and latency percentiles (seconds)
+    """
+    latencies = [result["latency"] for result in results]
+    failed = len([result for result in results if result["error"]])
+    return {
+        "total": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed else 0,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def format_summary(summary):
+    return (
+        f"{summary['succeeded']} of {summary['total']} succeeded, {summary['failed']} failed "
+        f"in {summary['elapsed']:.2f}s ({summary['throughput']:.2f}/s) - latency "
+        f"p50 {summary['p50']:.3f}s, p90 {summary['p90']:.3f}s, p99 {summary['p99']:.3f}s"
+    )
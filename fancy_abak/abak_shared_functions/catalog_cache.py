@@ -0,0 +1,190 @@
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .abak_configuration_functions import get_config
+
+DEFAULT_CATALOG_TTL = 3600
+DEFAULT_CATALOG_MAX_STALE = 7 * 86400
+# A refresh marker older than this was left by a process that died while refreshing
+REFRESH_MARKER_TIMEOUT = 120
+# Seconds a command waits, when it ends, for the refreshes it started
+REFRESH_EXIT_TIMEOUT = 2
+
+_refreshing = set()
+_refresh_threads = []
+_refreshing_lock = threading.Lock()
+
+
+def _get_setting(config, key, default):
+    try:
+        return float(config.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def catalog_file_path(config, path, client_id=None):
+    """
+    Returns the cache file of a catalog, one per endpoint, path, user and client filter
+    """
+    key = json.dumps(
+        [config.get("endpoint"), path, config.get("user_id"), client_id or ""]
+    )
+    return os.path.join(
+        config["app_dir"], "cache", hashlib.sha1(key.encode()).hexdigest() + ".json"
+    )
+
+
+def read_catalog(file_path):
+    try:
+        with open(file_path, "r") as file_reader:
+            return json.loads(file_reader.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_catalog(file_path, data):
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w") as file_writer:
+            file_writer.write(json.dumps({"fetched_at": time.time(), "data": data}))
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return data
+
+
+def _claim_refresh(file_path):
+    """
+    Creates the refresh marker of a catalog, next to its cache file, so that other
+    threads and abak processes don't refresh it at the same time
+
+    Returns:
+        bool: False if the catalog is already being refreshed
+    """
+    marker_path = file_path + ".refreshing"
+    with _refreshing_lock:
+        if file_path in _refreshing:
+            return False
+        try:
+            if time.time() - os.path.getmtime(marker_path) < REFRESH_MARKER_TIMEOUT:
+                return False
+            os.remove(marker_path)
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        try:
+            os.close(os.open(marker_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        _refreshing.add(file_path)
+    return True
+
+
+def _release_refresh(file_path):
+    with _refreshing_lock:
+        _refreshing.discard(file_path)
+        try:
+            os.remove(file_path + ".refreshing")
+        except FileNotFoundError:
+            pass
+
+
+@atexit.register
+def _release_all_refreshes():
+    # Most refreshes end within a short wait, the ones still running when the process
+    # leaves are left to the next command
+    deadline = time.time() + REFRESH_EXIT_TIMEOUT
+    for thread in list(_refresh_threads):
+        thread.join(max(deadline - time.time(), 0))
+    for file_path in list(_refreshing):
+        _release_refresh(file_path)
+
+
+def _refresh_in_background(file_path, fetch):
+    if not _claim_refresh(file_path):
+        return
+
+    def refresh():
+        try:
+            write_catalog(file_path, fetch())
+        except Exception:
+            # The cached catalog is still usable, the next command will try again
+            pass
+        finally:
+            _release_refresh(file_path)
+
+    # The command waits at most REFRESH_EXIT_TIMEOUT for the refresh when it ends
+    thread = threading.Thread(target=refresh, daemon=True)
+    with _refreshing_lock:
+        _refresh_threads[:] = [item for item in _refresh_threads if item.is_alive()]
+        _refresh_threads.append(thread)
+    thread.start()
+
+
+def get_catalog(path, fetch, client_id=None, refresh=False):
+    """
+    Returns a catalog (clients, projects...) from the cache under the app dir
+
+    A catalog younger than the "catalog_ttl" config key (seconds) is used as is. An older
+    one is still returned right away while a new copy is fetched in the background, that
+    the command waits for a couple of seconds at most when it ends. A catalog older than
+    "catalog_max_stale" is fetched before returning.
+
+    Args:
+        path (str): Abak path of the catalog, used in the cache key
+        fetch (function): returns the full catalog from Abak
+        client_id (str): client filter of the catalog, used in the cache key
+        refresh (bool): ignores the cache
+
+    Returns:
+        list: the catalog
+    """
+    config = get_config()
+    file_path = catalog_file_path(config, path, client_id)
+    cached = None if refresh else read_catalog(file_path)
+    if cached is None:
+        return write_catalog(file_path, fetch())
+
+    age = time.time() - cached.get("fetched_at", 0)
+    if age > _get_setting(config, "catalog_max_stale", DEFAULT_CATALOG_MAX_STALE):
+        return write_catalog(file_path, fetch())
+    if age > _get_setting(config, "catalog_ttl", DEFAULT_CATALOG_TTL):
+        _refresh_in_background(file_path, fetch)
+    return cached["data"]
+
+
+def is_catalog_fresh(path, client_id=None):
+    """
+    Returns:
+        bool: True if the catalog is cached and younger than the "catalog_ttl" config key
+    """
+    config = get_config()
+    cached = read_catalog(catalog_file_path(config, path, client_id))
+    return cached is not None and time.time() - cached.get(
+        "fetched_at", 0
+    ) <= _get_setting(config, "catalog_ttl", DEFAULT_CATALOG_TTL)
+
+
+def filter_catalog(catalog, query_text, keys):
+    """
+    Keeps the items where one of the keys contains query_text, ignoring the case
+    """
+    if not query_text:
+        return catalog
+    query_text = query_text.lower()
+    return [
+        item
+        for item in catalog
+        if any(query_text in str(item.get(key, "")).lower() for key in keys)
+    ]
@@ -0,0 +1,190 @@
+import copy
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_REMOVED = object()
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+@contextmanager
+def file_lock(lock_path):
+    """
+    Holds an exclusive lock on lock_path so that other abak processes wait for us
+
+    Args:
+        lock_path (str): path of the lock file, created if needed
+    """
+    with open(lock_path, "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class ConfigStore:
+    """
+    Keeps config.json in memory for the whole process
+
+    The file is only parsed again when its mtime changes, and writes only send the
+    keys that were changed by this process, merged on top of what is on disk.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.RLock()
+        self._data = {}
+        self._pending = {}
+        self._signature = None
+        self._view = None
+        self._load()
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _read(self):
+        try:
+            with open(self.file_path, "r") as file_reader:
+                content = file_reader.read()
+        except FileNotFoundError:
+            return {}, None
+        return (json.loads(content) if content.strip() else {}), content
+
+    def _load(self):
+        self._signature = self._stat_signature()
+        data, _ = self._read()
+        for key, value in self._pending.items():
+            if value is _REMOVED:
+                data.pop(key, None)
+            else:
+                data[key] = value
+        self._data = data
+        self._view = None
+
+    def _refresh(self):
+        if self._stat_signature() != self._signature:
+            self._load()
+
+    def view(self):
+        """
+        Returns:
+            MappingProxyType: read-only snapshot of the configuration
+        """
+        with self._lock:
+            self._refresh()
+            if self._view is None:
+                self._view = MappingProxyType(copy.deepcopy(self._data))
+            return self._view
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: a copy of the configuration that the caller is free to change
+        """
+        return copy.deepcopy(dict(self.view()))
+
+    def get(self, key, default=None):
+        return self.view().get(key, default)
+
+    @property
+    def dirty_keys(self):
+        return set(self._pending)
+
+    def set(self, key, value):
+        with self._lock:
+            self._refresh()
+            if key in self._data and self._data[key] == value:
+                return
+            self._data[key] = copy.deepcopy(value)
+            self._pending[key] = self._data[key]
+            self._view = None
+
+    def remove(self, key):
+        with self._lock:
+            self._refresh()
+            if key not in self._data:
+                return
+            del self._data[key]
+            self._pending[key] = _REMOVED
+            self._view = None
+
+    def update(self, values):
+        for key, value in values.items():
+            self.set(key, value)
+
+    def replace(self, data):
+        """
+        Makes the configuration equal to data, marking only the differences as changed
+        """
+        with self._lock:
+            self._refresh()
+            for key in [key for key in self._data if key not in data]:
+                self.remove(key)
+            self.update(data)
+
+    def save(self):
+        """
+        Writes the changed keys to disk, merged with the current content of the file
+
+        Returns:
+            bool: True if the file was written
+        """
+        with self._lock:
+            if not self._pending:
+                return False
+            directory = os.path.dirname(self.file_path)
+            os.makedirs(directory, exist_ok=True)
+            with file_lock(self.file_path + ".lock"):
+                data, old_content = self._read()
+                for key, value in self._pending.items():
+                    if value is _REMOVED:
+                        data.pop(key, None)
+                    else:
+                        data[key] = value
+                content = json.dumps(data)
+                written = content != old_content
+                if written:
+                    file_descriptor, temp_path = tempfile.mkstemp(
+                        dir=directory, prefix=".config-", suffix=".tmp"
+                    )
+                    try:
+                        with os.fdopen(file_descriptor, "w") as file_writer:
+                            file_writer.write(content)
+                        os.replace(temp_path, self.file_path)
+                    except BaseException:
+                        if os.path.exists(temp_path):
+                            os.remove(temp_path)
+                        raise
+                self._pending.clear()
+                self._data = data
+                self._signature = self._stat_signature()
+                self._view = None
+            return written
+
+
+def get_config_store(file_path):
+    """
+    Returns the store of the given config file, loading it on first use
+    """
+    with _stores_lock:
+        store = _stores.get(file_path)
+        if store is None:
+            store = ConfigStore(file_path)
+            _stores[file_path] = store
+    return store
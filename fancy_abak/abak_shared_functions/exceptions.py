@@ -2,4 +2,16 @@ from click import BadParameter
 
 class Sorry(BadParameter):
     def __init__(self, message):
-        super().__init__('Oh, hey there! Sorry bud, but ' + message + '!')
\ No newline at end of file
+        super().__init__('Oh, hey there! Sorry bud, but ' + message + '!')
+
+
+class Unreachable(Sorry):
+    """
+    Raised when Abak can't be reached, the writes can then be queued with --queue
+    """
+
+    def __init__(self, endpoint):
+        super().__init__(
+            f"could not reach Abak at {endpoint}, use --queue to record your changes "
+            "and send them later with 'abak timesheet flush'"
+        )
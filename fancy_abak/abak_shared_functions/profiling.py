@@ -0,0 +1,262 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_enabled = False
+_started = time.perf_counter()
+_events = []
+_events_lock = threading.Lock()
+_request_hooks = []
+_connection_phases = threading.local()
+
+
+def is_profiling():
+    return _enabled
+
+
+def enable_profiling():
+    """
+    Starts recording the spans and the requests of the process, and times how the
+    connections are opened
+    """
+    global _enabled
+    _enabled = True
+    # Everything before, like importing the CLI and parsing its arguments
+    add_event("startup", "startup", _started, time.perf_counter() - _started)
+    add_request_hook(record_request)
+    instrument_connections()
+
+
+def add_request_hook(hook):
+    """
+    Calls hook with a dict describing each request sent to Abak, once its response is
+    read: method, path, status, bytes, retries, started and total (seconds), and the
+    dns, connect and tls seconds spent opening a connection for it, when profiling
+
+    Args:
+        hook (function): takes the dict, its return value is ignored
+    """
+    if hook not in _request_hooks:
+        _request_hooks.append(hook)
+
+
+def remove_request_hook(hook):
+    if hook in _request_hooks:
+        _request_hooks.remove(hook)
+
+
+def has_request_hooks():
+    return bool(_request_hooks)
+
+
+def emit_request(record):
+    for hook in list(_request_hooks):
+        hook(record)
+
+
+def add_event(name, category, started, duration, args={}):
+    with _events_lock:
+        _events.append(
+            {
+                "name": name,
+                "category": category,
+                "started": started,
+                "duration": duration,
+                "thread": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+
+def get_events():
+    with _events_lock:
+        return list(_events)
+
+
+@contextmanager
+def span(name, category=None):
+    """
+    Records how long the block takes when profiling, does nothing otherwise
+
+    Args:
+        name (str): what the block does, like the path of a request
+        category (str): the line of the breakdown it adds up to, the name by default
+    """
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_event(name, category or name, started, time.perf_counter() - started)
+
+
+def record_request(record):
+    add_event(
+        f"{record['method']} {record['path']}",
+        "request",
+        record["started"],
+        record["total"],
+        {
+            key: value
+            for key, value in record.items()
+            if key not in ["started", "total"]
+        },
+    )
+
+
+def start_connection_phases():
+    """
+    Resets the connection phases of the thread, before it sends a request
+    """
+    _connection_phases.value = {"dns": 0.0, "connect": 0.0, "tls": 0.0}
+    return _connection_phases.value
+
+
+def get_connection_phases():
+    """
+    Returns:
+        dict: seconds spent by the thread on dns, connect and tls since its last request
+    """
+    return getattr(_connection_phases, "value", None) or start_connection_phases()
+
+
+def timed_phase(function, phase, inner_phases=[]):
+    """
+    Wraps function to add its duration to a connection phase, without the time of the
+    inner phases it goes through
+    """
+
+    def wrapper(*args, **kwargs):
+        phases = get_connection_phases()
+        inner_before = sum(phases[name] for name in inner_phases)
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - started
+            phases = get_connection_phases()
+            duration -= sum(phases[name] for name in inner_phases) - inner_before
+            phases[phase] += duration
+            add_event(phase, phase, started, duration)
+
+    return wrapper
+
+
+def instrument_connections():
+    """
+    Wraps the functions that resolve the host, open the socket and negotiate TLS, so
+    that each request knows how long its connection took to open
+    """
+    import socket
+
+    import urllib3.connection
+
+    if getattr(urllib3.connection.HTTPConnection, "_abak_profiled", False):
+        return
+    socket.getaddrinfo = timed_phase(socket.getaddrinfo, "dns")
+    urllib3.connection.HTTPConnection._new_conn = timed_phase(
+        urllib3.connection.HTTPConnection._new_conn, "connect", ["dns"]
+    )
+    urllib3.connection.HTTPSConnection.connect = timed_phase(
+        urllib3.connection.HTTPSConnection.connect, "tls", ["dns", "connect"]
+    )
+    urllib3.connection.HTTPConnection._abak_profiled = True
+
+
+def summarize_events(events):
+    """
+    Returns:
+        list: [category, calls, seconds] rows, the slowest first
+    """
+    totals = {}
+    for event in events:
+        total = totals.setdefault(event["category"], [event["category"], 0, 0.0])
+        total[1] += 1
+        total[2] += event["duration"]
+    return sorted(totals.values(), key=lambda total: total[2], reverse=True)
+
+
+def format_profile(events, elapsed):
+    """
+    Builds the breakdown printed by --profile: the time of each category, then each
+    request with its status, size, retries and connection phases. Concurrent requests
+    add up to more than the time of the command.
+    """
+    from tabulate import tabulate
+
+    breakdown = tabulate(
+        [
+            [category, calls, f"{seconds * 1000:.1f}", f"{seconds / elapsed:.0%}"]
+            for category, calls, seconds in summarize_events(events)
+        ],
+        headers=["Span", "Calls", "ms", "Of total"],
+        numalign="left",
+    )
+    requests = tabulate(
+        [
+            [
+                event["name"],
+                event["args"].get("status"),
+                event["args"].get("bytes"),
+                event["args"].get("retries"),
+                f"{event['args'].get('dns', 0) * 1000:.1f}",
+                f"{event['args'].get('connect', 0) * 1000:.1f}",
+                f"{event['args'].get('tls', 0) * 1000:.1f}",
+                f"{event['duration'] * 1000:.1f}",
+            ]
+            for event in sorted(events, key=lambda event: event["started"])
+            if event["category"] == "request"
+        ],
+        headers=[
+            "Request",
+            "Status",
+            "Bytes",
+            "Retries",
+            "DNS",
+            "Connect",
+            "TLS",
+            "ms",
+        ],
+        numalign="left",
+    )
+    return (
+        f"Profile of {elapsed * 1000:.1f}ms since fancy_abak was imported\n\n"
+        f"{breakdown}\n\n{requests}"
+    )
+
+
+def write_chrome_trace(file_path, events):
+    """
+    Writes the events in the Trace Event Format, which chrome://tracing and Perfetto
+    open, with one line per thread
+    """
+    threads = {}
+    trace_events = []
+    for event in sorted(events, key=lambda event: event["started"]):
+        thread = threads.setdefault(event["thread"], len(threads))
+        trace_events.append(
+            {
+                "name": event["name"],
+                "cat": event["category"],
+                "ph": "X",
+                "ts": round((event["started"] - _started) * 1000000, 1),
+                "dur": round(event["duration"] * 1000000, 1),
+                "pid": os.getpid(),
+                "tid": thread,
+                "args": event["args"],
+            }
+        )
+    with open(file_path, "w") as file_writer:
+        json.dump(
+            {"traceEvents": trace_events, "displayTimeUnit": "ms"},
+            file_writer,
+            default=str,
+        )
+
+
+def profile_elapsed():
+    return time.perf_counter() - _started
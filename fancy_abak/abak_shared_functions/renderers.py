@@ -0,0 +1,111 @@
+import csv
+import itertools
+import json
+import sys
+
+from .profiling import span
+
+OUTPUT_FORMATS = ["table", "json", "ndjson", "csv", "yaml", "yml"]
+
+
+def as_dict(row, headers):
+    if isinstance(row, dict):
+        return (
+            row if headers is None else {header: row.get(header) for header in headers}
+        )
+    return dict(zip(headers, row))
+
+
+def as_list(row, headers):
+    if isinstance(row, dict):
+        return [row.get(header) for header in headers]
+    return row
+
+
+def get_yaml_dumper():
+    """
+    Returns the libyaml dumper when PyYAML was built with it, it is several times faster
+    """
+    import yaml
+
+    return getattr(yaml, "CDumper", yaml.Dumper)
+
+
+def render_json(rows, headers, file):
+    # Same output as json.dumps on the whole list, written one row at a time
+    file.write("[")
+    for index, row in enumerate(rows):
+        file.write((", " if index else "") + json.dumps(as_dict(row, headers)))
+    file.write("]\n")
+
+
+def render_ndjson(rows, headers, file):
+    for row in rows:
+        file.write(json.dumps(as_dict(row, headers)) + "\n")
+
+
+def render_csv(rows, headers, file):
+    writer = csv.writer(file, lineterminator="\n")
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow(as_list(row, headers))
+
+
+def render_yaml(rows, headers, file):
+    import yaml
+
+    dumper = get_yaml_dumper()
+    empty = True
+    for row in rows:
+        # The items of a block sequence dumped one by one make the same document as
+        # the whole sequence
+        file.write(yaml.dump([as_dict(row, headers)], Dumper=dumper))
+        empty = False
+    if empty:
+        file.write("[]\n")
+    file.write("\n")
+
+
+def render_table(rows, headers, file, page_size=0, **table_options):
+    from tabulate import tabulate
+
+    rows = (as_list(row, headers) for row in rows)
+    if not page_size:
+        file.write(tabulate(list(rows), headers=headers, **table_options) + "\n")
+        return
+    for index, page in enumerate(
+        iter(lambda: list(itertools.islice(rows, page_size)), [])
+    ):
+        file.write(
+            ("\n" if index else "")
+            + tabulate(page, headers=headers, **table_options)
+            + "\n"
+        )
+
+
+def render(rows, headers, output, file=None, page_size=0, **table_options):
+    """
+    Writes rows in the given output format as they are produced, without building the
+    whole output in memory first
+
+    Args:
+        rows (iterable): lists with one value per header, or dicts
+        headers (list): the columns, None keeps every key of dict rows in json, ndjson
+            and yaml
+        output (str): one of OUTPUT_FORMATS
+        file: where to write, the standard output by default
+        page_size (int): rows of each table, 0 writes a single table
+        **table_options: other arguments of tabulate, like numalign
+    """
+    file = file or sys.stdout
+    with span("render"):
+        if output == "json":
+            render_json(rows, headers, file)
+        elif output == "ndjson":
+            render_ndjson(rows, headers, file)
+        elif output == "csv":
+            render_csv(rows, headers, file)
+        elif output in ["yaml", "yml"]:
+            render_yaml(rows, headers, file)
+        else:
+            render_table(rows, headers, file, page_size, **table_options)
@@ -1,74 +1,255 @@
 import requests
-from .exceptions import Sorry
-from .abak_configuration_functions import get_config, write_config_file
+from .exceptions import Sorry, Unreachable
+from .abak_configuration_functions import get_config, update_config
+from .session_functions import session_request
+from .token_manager import ensure_fresh_token, refresh_token
+from .profiling import span
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
+DEFAULT_IDENTITY_TTL = 86400
+DEFAULT_PAGE_SIZE = 50
 
-def convert_date(text):
-    start = text.find("new Date")
-    finish = text.find("),", start) + 1
-    next_instance = finish
-    while next_instance > 0:
-        date_to_convert = text[start:finish]
-        date_to_convert_array = date_to_convert[
-            date_to_convert.find("(") + 1 : date_to_convert.find(")")
-        ].split(",")
-        date_output = f'"{date_to_convert_array[0]}-{int(date_to_convert_array[1])+1:02d}-{date_to_convert_array[2]}T00:00:00"'
-        text = text.replace(date_to_convert, date_output)
-        start = text.find("new Date", next_instance)
-        finish = text.find("),", start) + 1
-        next_instance = finish
-
-    return text
-
-
-def httprequest(request_type, body, path, is_json=False, headers={}):
-    request_function = {"GET": requests.get, "POST": requests.post}.get(
-        request_type.upper(), None
+
+DATE_PATTERN = re.compile(r"new Date\(\s*(-?\d+(?:\s*,\s*-?\d+)*)\s*\)")
+# Prefix of the dates that parse_abak_json turns into datetime objects, escaped for
+# JSON and once decoded. Abak never sends strings starting with a NUL character.
+DATE_MARKER_JSON = "\\u0000"
+DATE_MARKER = "\x00"
+
+
+def _date_parts(arguments):
+    parts = [int(part) for part in arguments.split(",")]
+    if len(parts) == 1:
+        # new Date(milliseconds) counts from the epoch
+        moment = datetime(1970, 1, 1) + timedelta(milliseconds=parts[0])
+        return moment.timetuple()[:6]
+    # new Date(year, monthIndex[, day[, hours[, minutes[, seconds[, ms]]]]])
+    defaults = [None, None, 1, 0, 0, 0]
+    year, month, day, hour, minute, second = (parts + defaults[len(parts) :])[:6]
+    return year, month + 1, day, hour, minute, second
+
+
+def _format_date(match, prefix=""):
+    year, month, day, hour, minute, second = _date_parts(match.group(1))
+    return (
+        f'"{prefix}{year:04d}-{month:02d}-{day:02d}'
+        f'T{hour:02d}:{minute:02d}:{second:02d}"'
     )
 
-    config = get_config()
-    headers["Cookie"] = config["token"]
+
+def convert_date(text):
+    """
+    Replaces every javascript "new Date(...)" literal in an Abak response with an
+    ISO formatted string, in a single pass over the text
+
+    Args:
+        text (str): body of the response
+
+    Returns:
+        str: the body as valid JSON
+    """
+    return DATE_PATTERN.sub(_format_date, text)
+
+
+def _restore_dates(value):
+    if isinstance(value, str) and value.startswith(DATE_MARKER):
+        return datetime.fromisoformat(value[1:])
+    if isinstance(value, list):
+        return [_restore_dates(item) for item in value]
+    return value
+
+
+def parse_abak_json(text, as_datetime=False):
+    """
+    Parses an Abak response, converting its dates on the way
+
+    Args:
+        text (str): body of the response
+        as_datetime (bool): returns the dates as datetime objects instead of ISO strings
+
+    Returns:
+        dict: the parsed response
+    """
+    if not as_datetime:
+        with span("convert dates"):
+            text = convert_date(text)
+        with span("parse json"):
+            return json.loads(text)
+    with span("convert dates"):
+        return _restore_dates(
+            json.loads(
+                DATE_PATTERN.sub(
+                    lambda match: _format_date(match, DATE_MARKER_JSON), text
+                ),
+                object_hook=lambda item: {
+                    key: _restore_dates(value) for key, value in item.items()
+                },
+            )
+        )
+
+
+def send_request(config, request_type, endpoint, path, **kwargs):
+    """
+    Sends a request with session_request, raising Unreachable instead of the connection
+    errors and timeouts of requests
+    """
+    try:
+        return session_request(config, request_type, endpoint + path, **kwargs)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        raise Unreachable(endpoint)
+
+
+def is_authentication_error(result):
+    return result.status_code in (401, 403) or "/account/login" in result.url.lower()
+
+
+def httprequest(request_type, body, path, is_json=False, headers={}, retry_auth=True):
+    config = ensure_fresh_token(get_config())
+    token = config["token"]
+    # A copy, the default headers are shared by the threads sending requests
+    headers = {**headers, "Cookie": token}
 
     if is_json:
-        result = request_function(config["endpoint"] + path, headers=headers, json=body)
+        result = send_request(
+            config, request_type, config["endpoint"], path, headers=headers, json=body
+        )
     else:
-        result = request_function(config["endpoint"] + path, headers=headers, data=body)
+        result = send_request(
+            config, request_type, config["endpoint"], path, headers=headers, data=body
+        )
+    if retry_auth and is_authentication_error(result):
+        # Every request refused with this token waits for a single login
+        refresh_token(token)
+        return httprequest(request_type, body, path, is_json, headers, retry_auth=False)
     try:
         result.raise_for_status()
-        output_value = json.loads(convert_date(result.text))
+        output_value = parse_abak_json(result.text)
         return output_value
     except requests.exceptions.HTTPError as error:
         raise Sorry(re.findall("(<title>)(.*)(</title>)", result.text)[0][1])
 
 
-def fancy_abak_request(request_type, body, path, is_json, headers={}):
-    request_function = {
-        "GET": requests.get,
-        "POST": requests.post,
-        "DELETE": requests.delete,
-    }.get(request_type.upper(), None)
+def paginate(
+    request_type,
+    body,
+    path,
+    is_json=False,
+    headers={},
+    page_size=DEFAULT_PAGE_SIZE,
+    concurrency=4,
+):
+    """
+    Walks every page of a paginated Abak listing, using "start"/"limit" in the request
+    and "total" in the response
+
+    The first page tells how many rows there are, the other pages are then fetched
+    concurrently and their rows yielded in order as soon as each page arrives.
+
+    Args:
+        request_type (str): HTTP method
+        body (dict): body of the request, without "start" and "limit"
+        path (str): Abak path of the listing
+        is_json (bool): sends the body as JSON
+        headers (dict): headers of the request
+        page_size (int): rows asked per page
+        concurrency (int): maximum number of pages fetched at the same time
+
+    Yields:
+        dict: each row of the listing
+    """
+
+    def fetch_page(start, limit):
+        page_body = {**body, "start": start, "limit": limit}
+        return httprequest(request_type, page_body, path, is_json, dict(headers))
+
+    first_page = fetch_page(0, page_size)
+    rows = first_page.get("data") or []
+    yield from rows
+    total = first_page.get("total")
+    # Abak may return less rows than asked for, that is its real page size
+    page_size = len(rows) or page_size
 
+    if total is None:
+        start = len(rows)
+        while len(rows) == page_size:
+            rows = fetch_page(start, page_size).get("data") or []
+            yield from rows
+            start += len(rows)
+        return
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        pages = [
+            executor.submit(fetch_page, start, page_size)
+            for start in range(len(rows), int(total), page_size)
+        ]
+        for page in pages:
+            yield from page.result().get("data") or []
+
+
+def validate_identity(config, force=False):
+    """
+    Makes sure config["user_id"] is set, asking Abak for it only when the cached one
+    is older than the "user_id_ttl" config key (in seconds)
+
+    Args:
+        config (dict): the configuration, updated in place
+        force (bool): ignores the cached user_id
+
+    Returns:
+        str: the user_id of the logged in employee
+    """
+    try:
+        ttl = float(config.get("user_id_ttl", DEFAULT_IDENTITY_TTL))
+    except (TypeError, ValueError):
+        ttl = DEFAULT_IDENTITY_TTL
+    try:
+        validated_at = float(config.get("user_id_validated_at", 0))
+    except (TypeError, ValueError):
+        # An invalid time is an expired one, the user_id is asked again
+        validated_at = 0
+    if not force and config.get("user_id") and time.time() - validated_at < ttl:
+        return config["user_id"]
+
+    result = httprequest("get", None, "/Abak/Transact/GetEmployee_Optimized")
+    identity = {"user_id": result["data"][0]["Id"], "user_id_validated_at": time.time()}
+    config.update(get_config(), **identity)
+    update_config(identity)
+    return config["user_id"]
+
+
+def fancy_abak_request(request_type, body, path, is_json, headers={}):
     config = get_config()
     headers["Authorization"] = config["access_token"]
     if path == "/chat":
         if config.get("thread_id"):
             body["thread_id"] = config.get("thread_id")
     if is_json:
-        result = request_function(
-            config["fancy_abak_endpoint"] + path, headers=headers, json=body
+        result = send_request(
+            config,
+            request_type,
+            config["fancy_abak_endpoint"],
+            path,
+            headers=headers,
+            json=body,
         )
     else:
-        result = request_function(
-            config["fancy_abak_endpoint"] + path, headers=headers, data=body
+        result = send_request(
+            config,
+            request_type,
+            config["fancy_abak_endpoint"],
+            path,
+            headers=headers,
+            data=body,
         )
     try:
         result.raise_for_status()
-        output_value = json.loads(convert_date(result.text))
+        output_value = parse_abak_json(result.text)
         if path == "/chat":
-            config["thread_id"] = output_value["thread_id"]
-            write_config_file(config["config_file_path"], config)
+            update_config({"thread_id": output_value["thread_id"]})
         return output_value
     except requests.exceptions.HTTPError as error:
         raise Sorry(re.findall("(<title>)(.*)(</title>)", result.text)[0][1])
@@ -0,0 +1,160 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .profiling import has_request_hooks, emit_request, start_connection_phases
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 3
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_setting(config, key, default, cast):
+    try:
+        return cast(config.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _base_url(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Creates a keep-alive session with a connection pool and retry policy
+
+    POST requests are only retried when the connection could not be opened,
+    since endpoints like /Abak/Timesheet/Edit are not idempotent.
+
+    Args:
+        pool_size (int): maximum number of connections kept open per host
+        max_retries (int): number of retries on connection errors and 5xx responses
+
+    Returns:
+        requests.Session: the configured session
+    """
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUS_CODES,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(url, config={}):
+    """
+    Returns the shared session for the endpoint of the given url, creating it on first use
+
+    Args:
+        url (str): any url on the endpoint
+        config (dict): configuration holding the optional "pool_size" and "max_retries" keys
+
+    Returns:
+        requests.Session: the pooled session for that endpoint
+    """
+    base_url = _base_url(url)
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = create_session(
+                _get_setting(config, "pool_size", DEFAULT_POOL_SIZE, int),
+                _get_setting(config, "max_retries", DEFAULT_MAX_RETRIES, int),
+            )
+            _sessions[base_url] = session
+    return session
+
+
+def session_request(config, method, url, **kwargs):
+    """
+    Sends a request through the pooled session of the endpoint, and describes it to the
+    hooks added with add_request_hook
+
+    Args:
+        config (dict): configuration holding the optional "request_timeout" key (seconds)
+        method (str): HTTP method
+        url (str): full url of the request
+        **kwargs: any other argument accepted by requests.Session.request
+
+    Returns:
+        requests.Response: the response of the request
+    """
+    kwargs.setdefault(
+        "timeout", _get_setting(config, "request_timeout", DEFAULT_TIMEOUT, float)
+    )
+    session = get_session(url, config)
+    if not has_request_hooks():
+        return session.request(method.upper(), url, **kwargs)
+
+    phases = start_connection_phases()
+    started = time.perf_counter()
+    response = None
+    try:
+        response = session.request(method.upper(), url, **kwargs)
+        return response
+    finally:
+        retries = getattr(getattr(response, "raw", None), "retries", None)
+        emit_request(
+            {
+                "method": method.upper(),
+                "path": urlsplit(url).path,
+                "status": getattr(response, "status_code", None),
+                "bytes": len(response.content) if response is not None else 0,
+                "retries": len(getattr(retries, "history", None) or []),
+                "started": started,
+                "total": time.perf_counter() - started,
+                **phases,
+            }
+        )
+
+
+def get_connection_stats():
+    """
+    Counts the connections opened and reused by every pooled session
+
+    Returns:
+        dict: {endpoint: {"requests": int, "opened": int, "reused": int}}
+    """
+    stats = {}
+    with _sessions_lock:
+        for base_url, session in _sessions.items():
+            requests_made = 0
+            opened = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_made += pool.num_requests
+                    opened += pool.num_connections
+            stats[base_url] = {
+                "requests": requests_made,
+                "opened": opened,
+                "reused": max(requests_made - opened, 0),
+            }
+    return stats
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,101 @@
+import os
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from .abak_configuration_functions import get_config, reauthenticate
+from .config_store import file_lock
+
+DEFAULT_REFRESH_MARGIN = 300
+LOGIN_LOCK_FILE = "login.lock"
+# requests joins the Set-Cookie headers with ", ", which dates also contain
+EXPIRES_PATTERN = re.compile(
+    r"expires\s*=\s*(\w{3},\s*\d{1,2}[ -]\w{3}[ -]\d{2,4}\s+\d{1,2}:\d{2}:\d{2}\s*GMT)",
+    re.IGNORECASE,
+)
+MAX_AGE_PATTERN = re.compile(r"max-age\s*=\s*(-?\d+)", re.IGNORECASE)
+
+_login_lock = threading.Lock()
+
+
+def parse_cookie_expiry(set_cookie, now=None):
+    """
+    Finds when the first of the cookies sent by Abak at login expires
+
+    Args:
+        set_cookie (str): the Set-Cookie header of the login response
+        now (float): the time of the response, as a timestamp
+
+    Returns:
+        float: the timestamp of the earliest expiry to come, None for session cookies
+    """
+    now = time.time() if now is None else now
+    expiries = [
+        now + int(max_age) for max_age in MAX_AGE_PATTERN.findall(set_cookie or "")
+    ]
+    for expires in EXPIRES_PATTERN.findall(set_cookie or ""):
+        try:
+            expiries.append(parsedate_to_datetime(expires).timestamp())
+        except (TypeError, ValueError):
+            pass
+    # Cookies expiring in the past are the ones Abak deletes
+    expiries = [expiry for expiry in expiries if expiry > now]
+    return min(expiries) if expiries else None
+
+
+def is_token_expiring(config):
+    """
+    Tells if the token expires within the "token_refresh_margin" config key (seconds),
+    or within half of its lifetime when it is shorter
+    """
+    expires_at = config.get("token_expires_at")
+    if not expires_at:
+        return False
+    try:
+        margin = float(config.get("token_refresh_margin", DEFAULT_REFRESH_MARGIN))
+    except (TypeError, ValueError):
+        margin = DEFAULT_REFRESH_MARGIN
+    issued_at = config.get("token_issued_at")
+    if issued_at:
+        margin = min(margin, (float(expires_at) - float(issued_at)) / 2)
+    return time.time() >= float(expires_at) - margin
+
+
+def refresh_token(stale_token):
+    """
+    Logs in again, unless another thread or abak process already did since stale_token
+    was read: they wait for each other, so that a single login is sent
+
+    Args:
+        stale_token (str): the token that expired, or is about to
+
+    Returns:
+        dict: the configuration with the new token
+    """
+    with _login_lock:
+        config = get_config()
+        with file_lock(os.path.join(config["app_dir"], LOGIN_LOCK_FILE)):
+            config = get_config()
+            if config.get("token") != stale_token and not is_token_expiring(config):
+                return config
+            reauthenticate()
+            return get_config()
+
+
+def ensure_fresh_token(config):
+    """
+    Logs in before the token expires, when Abak told when it does
+
+    Returns:
+        dict: the configuration to send the request with
+    """
+    if not is_token_expiring(config):
+        return config
+    try:
+        return refresh_token(config.get("token"))
+    except Exception:
+        # The token still works until it expires, the request can go on with it
+        if time.time() >= float(config["token_expires_at"]):
+            raise
+        return config
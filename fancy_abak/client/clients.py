@@ -1,10 +1,15 @@
 from fancy_abak.abak_config.remove import remove_configuration_key
 from fancy_abak.abak_config.set import set_configuration_key
 import click
-import json
-from pyfzf import FzfPrompt
-from tabulate import tabulate
-from fancy_abak.abak_shared_functions import get_config, httprequest
+from fancy_abak.abak_shared_functions import (
+    get_config,
+    render,
+    paginate,
+    get_catalog,
+    filter_catalog,
+)
+
+CLIENTS_PATH = "/Abak/Common/GetTimesheetClientsPaginated"
 
 
 @click.group()
@@ -22,27 +27,31 @@ def client(ctx):
     "-o",
     "--output",
     help="The format of the output of this command",
-    type=click.Choice(["json", "table"]),
+    type=click.Choice(["json", "ndjson", "csv", "table", "yaml"]),
     default="table",
 )
 @click.option(
     "--query-text", "-q", help="Text to search for in the client name", default=""
 )
-def client_list(ctx, output, query_text):
+@click.option("--refresh", help="Ignores the cached list of clients", is_flag=True)
+def client_list(ctx, output, query_text, refresh):
     """
     Lists the clients available
     """
-    get_clients(query_text, output)
+    get_clients(query_text, output, refresh)
 
 
 @click.command(name="select")
 @click.pass_context
-def client_select(ctx):
+@click.option("--refresh", help="Ignores the cached list of clients", is_flag=True)
+def client_select(ctx, refresh):
     """
     Selects the default client ID to use
     """
-    clients_list = get_clients("", "python")
+    clients_list = get_clients("", "python", refresh)
     if len(clients_list) > 1:
+        from pyfzf import FzfPrompt
+
         fzf = FzfPrompt()
         selected_dirty = fzf.prompt(
             [
@@ -58,31 +67,32 @@ def client_select(ctx):
     click.echo("Client " + selected + " selected as default!")
 
 
-def get_clients(query_text, output):
+def fetch_clients():
     config = get_config()
     body = {
-        "queryText": query_text,
-        "start": 0,
-        "limit": 22,
+        "queryText": "",
         "employeeId": config["user_id"],
     }
+    return list(paginate("GET", body, CLIENTS_PATH))
 
-    clients = httprequest("GET", body, "/Abak/Common/GetTimesheetClientsPaginated")
 
-    if output == "table":
-        headers = ["Id", "DisplayName"]
-        table = tabulate(
-            [
-                [client[key] for key in client if key in headers]
-                for client in clients.get("data")
-            ],
-            headers=headers,
+def get_clients(query_text, output, refresh=False):
+    clients = {
+        "data": filter_catalog(
+            get_catalog(CLIENTS_PATH, fetch_clients, refresh=refresh),
+            query_text,
+            ["Id", "DisplayName"],
         )
-        print(table)
-    elif output == "json":
-        print(json.dumps(clients.get("data")))
-    elif output == "python":
+    }
+
+    if output == "python":
         return clients.get("data")
+    # The json, ndjson and yaml outputs keep every key of the clients
+    render(
+        clients.get("data"),
+        ["Id", "DisplayName"] if output in ["table", "csv"] else None,
+        output,
+    )
 
 
 client.add_command(client_list)
@@ -0,0 +1,241 @@
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime
+
+import click
+
+from fancy_abak.abak_shared_functions import Sorry, get_config, error_message
+from fancy_abak.daemon_client import get_socket_path, send
+
+LOG_FILE = "daemon.log"
+DEFAULT_REFRESH = 60
+START_TIMEOUT = 10
+
+
+def log(message):
+    click.echo(f"{datetime.now().isoformat(timespec='seconds')} {message}", err=True)
+
+
+class Daemon:
+    """
+    Answers the commands sent by daemon_client on a Unix socket, one at a time, in a
+    process that keeps the session, the configuration and the transactions warm
+
+    Args:
+        cli (click.Group): the abak command
+        socket_path (str): where to listen
+        refresh (int): seconds between refreshes of the transactions of the current week
+    """
+
+    def __init__(self, cli, socket_path, refresh=DEFAULT_REFRESH):
+        self.cli = cli
+        self.socket_path = socket_path
+        self.refresh = refresh
+        self.started = time.time()
+        self.stopped = threading.Event()
+        # Commands change os.environ, the directory and sys.stdout of the whole process
+        self.command_lock = threading.Lock()
+
+    def run_command(self, request):
+        from fancy_abak.shell import run_line
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with self.command_lock:
+            cwd = os.getcwd()
+            try:
+                os.chdir(request.get("cwd") or cwd)
+                with redirect_stdout(stdout), redirect_stderr(stderr):
+                    code = run_line(self.cli, list(request["argv"]), request.get("env"))
+            except OSError as error:
+                stderr.write(f"Error: {error_message(error)}\n")
+                code = 1
+            finally:
+                os.chdir(cwd)
+        return {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "code": code}
+
+    def answer(self, request):
+        if request.get("stop"):
+            self.stopped.set()
+            return {"stopped": True}
+        if "argv" in request:
+            return self.run_command(request)
+        return {
+            "pid": os.getpid(),
+            "started": self.started,
+            "refresh": self.refresh,
+        }
+
+    def handle(self, connection):
+        with connection:
+            try:
+                with connection.makefile("rb") as reader:
+                    request = json.loads(reader.readline())
+                response = self.answer(request)
+            except Exception as error:
+                response = {"stderr": f"Error: {error_message(error)}\n", "code": 1}
+            try:
+                connection.sendall(json.dumps(response).encode() + b"\n")
+            except OSError:
+                pass
+
+    def refresh_current_week(self):
+        from fancy_abak.timesheets.transactions import get_transactions
+
+        with self.command_lock:
+            config = get_config()
+            get_transactions(
+                datetime.now().strftime(config["date_format"]), "Weekly", refresh=True
+            )
+
+    def refresh_loop(self):
+        while not self.stopped.is_set():
+            try:
+                self.refresh_current_week()
+            except Exception as error:
+                log(f"could not refresh the current week: {error_message(error)}")
+            self.stopped.wait(self.refresh)
+
+    def serve(self):
+        from fancy_abak.timesheets.transactions import enable_memory_cache
+
+        if os.path.exists(self.socket_path):
+            if send({}, timeout=1) is not None:
+                raise Sorry("the daemon is already running")
+            os.remove(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only the user can connect, the socket is created without permissions for
+        # anyone else
+        umask = os.umask(0o177)
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        server.listen()
+        server.settimeout(1)
+        enable_memory_cache(self.refresh)
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stopped.set())
+        threading.Thread(target=self.refresh_loop, daemon=True).start()
+        log(f"listening on {self.socket_path}, pid {os.getpid()}")
+        try:
+            while not self.stopped.is_set():
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    continue
+                connection.settimeout(None)
+                threading.Thread(
+                    target=self.handle, args=(connection,), daemon=True
+                ).start()
+        finally:
+            server.close()
+            os.remove(self.socket_path)
+            log("stopped")
+
+
+@click.group()
+def daemon():
+    """
+    Keeps abak running in the background, the read-only commands like "timesheet list"
+    are then answered by it without logging in again or fetching what it already has.
+    Commands run in the shell without the daemon when it is not running, or when
+    ABAK_NO_DAEMON is set.
+    """
+    pass
+
+
+@click.command(name="start")
+@click.option(
+    "--refresh",
+    help="Seconds between refreshes of the timesheet entries of the current week",
+    type=click.IntRange(min=1),
+    default=DEFAULT_REFRESH,
+    show_default=True,
+)
+@click.option(
+    "--foreground", help="Runs the daemon in this terminal until Ctrl-C", is_flag=True
+)
+@click.pass_context
+def daemon_start(ctx, refresh, foreground):
+    """
+    Starts the daemon, its log is in the daemon.log file of the config directory
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise Sorry("the daemon needs Unix sockets, which this system doesn't have")
+    socket_path = get_socket_path()
+    if foreground:
+        try:
+            Daemon(ctx.find_root().command, socket_path, refresh).serve()
+        except KeyboardInterrupt:
+            pass
+        return
+    if send({}, timeout=1) is not None:
+        raise Sorry("the daemon is already running")
+
+    log_path = os.path.join(get_config()["app_dir"], LOG_FILE)
+    with open(log_path, "a") as log_file:
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "fancy_abak.abak",
+                "daemon",
+                "start",
+                "--foreground",
+                "--refresh",
+                str(refresh),
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=log_file,
+            start_new_session=True,
+        )
+    deadline = time.time() + START_TIMEOUT
+    while time.time() < deadline:
+        status = send({}, timeout=1)
+        if status:
+            click.echo(f"Daemon started, pid {status['pid']}")
+            return
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    raise Sorry(f"the daemon did not start, see {log_path}")
+
+
+@click.command(name="stop")
+def daemon_stop():
+    """
+    Stops the daemon
+    """
+    if send({"stop": True}, timeout=5) is None:
+        raise Sorry("the daemon is not running")
+    click.echo("Daemon stopped")
+
+
+@click.command(name="status")
+@click.pass_context
+def daemon_status(ctx):
+    """
+    Tells if the daemon is running, exits with 1 when it is not
+    """
+    status = send({}, timeout=1)
+    if not status:
+        click.echo("The daemon is not running")
+        ctx.exit(1)
+    click.echo(
+        f"The daemon is running, pid {status['pid']}, for "
+        f"{int(time.time() - status['started'])}s, refreshing the current week every "
+        f"{status['refresh']}s"
+    )
+
+
+daemon.add_command(daemon_start)
+daemon.add_command(daemon_stop)
+daemon.add_command(daemon_status)
@@ -0,0 +1,88 @@
+import json
+import os
+import socket
+import sys
+
+import click
+
+SOCKET_FILE = "daemon.sock"
+# Only the commands that read from Abak are sent to the daemon: when it doesn't answer,
+# they can run again in this process without doing anything twice
+FORWARDED_COMMANDS = [
+    ("timesheet", "list"),
+    ("timesheet", "report"),
+    ("context", "list"),
+    ("context", "current"),
+    ("context", "show"),
+    ("client", "list"),
+    ("project", "list"),
+]
+CONNECT_TIMEOUT = 0.5
+RESPONSE_TIMEOUT = 300
+
+
+def get_socket_path():
+    return os.path.join(click.get_app_dir(".abakctl"), SOCKET_FILE)
+
+
+def send(message, timeout=RESPONSE_TIMEOUT):
+    """
+    Sends a message to the daemon, as a line of JSON, and waits for its answer
+
+    Returns:
+        dict: the answer of the daemon, None when it isn't running or didn't answer
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(CONNECT_TIMEOUT)
+            client.connect(get_socket_path())
+            client.settimeout(timeout)
+            client.sendall(json.dumps(message).encode() + b"\n")
+            with client.makefile("rb") as reader:
+                line = reader.readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError):
+        return None
+
+
+def is_forwarded(argv):
+    # Global options, like --profile, describe this process and are never forwarded
+    return (
+        not os.environ.get("ABAK_NO_DAEMON")
+        and len(argv) >= 2
+        and tuple(argv[:2]) in FORWARDED_COMMANDS
+    )
+
+
+def forward(argv):
+    """
+    Runs a command in the daemon, with the environment and the directory of this process
+
+    Returns:
+        int: the exit code of the command, None when the daemon didn't run it
+    """
+    response = send({"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)})
+    if not response or "code" not in response:
+        return None
+    sys.stdout.write(response.get("stdout", ""))
+    sys.stdout.flush()
+    sys.stderr.write(response.get("stderr", ""))
+    return response["code"]
+
+
+def main():
+    """
+    Entry point of abak: the read-only commands are answered by the daemon when it runs,
+    everything else, and everything when it doesn't, runs in this process
+    """
+    argv = sys.argv[1:]
+    if is_forwarded(argv):
+        code = forward(argv)
+        if code is not None:
+            sys.exit(code)
+
+    from fancy_abak.abak import abak
+
+    abak()
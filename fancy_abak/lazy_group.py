@@ -0,0 +1,48 @@
+import importlib
+
+import click
+
+from fancy_abak.abak_shared_functions.profiling import span
+
+
+class LazyGroup(click.Group):
+    """
+    Click group that only imports the module of a subcommand when it is used
+
+    Args:
+        lazy_subcommands (dict): {name: ("package.module:attribute", "short help")}
+    """
+
+    def __init__(self, *args, lazy_subcommands={}, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_subcommands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands and cmd_name not in self.commands:
+            module_name, attribute = self.lazy_subcommands[cmd_name][0].split(":")
+            with span(f"import {module_name}", "import"):
+                command = getattr(importlib.import_module(module_name), attribute)
+            self.add_command(command, cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        # Same as click.Group.format_commands, without loading the lazy subcommands
+        commands = []
+        for name in self.list_commands(ctx):
+            command = self.commands.get(name)
+            if command is None:
+                commands.append((name, self.lazy_subcommands[name][1]))
+            elif not command.hidden:
+                commands.append((name, command))
+        if not commands:
+            return
+        limit = formatter.width - 6 - max(len(name) for name, _ in commands)
+        rows = [
+            (name, help if isinstance(help, str) else help.get_short_help_str(limit))
+            for name, help in commands
+        ]
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
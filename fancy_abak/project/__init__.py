@@ -1 +1 @@
-from .projects import project, get_projects
\ No newline at end of file
+from .projects import project, get_projects, PROJECTS_PATH
\ No newline at end of file
@@ -1,11 +1,16 @@
 from fancy_abak.abak_config.set import set_configuration_key
 import click
-from pyfzf import FzfPrompt
-from tabulate import tabulate
-import json
-from fancy_abak.abak_shared_functions import get_config, httprequest
+from fancy_abak.abak_shared_functions import (
+    get_config,
+    render,
+    paginate,
+    get_catalog,
+    filter_catalog,
+)
 from os import environ
 
+PROJECTS_PATH = "/Abak/Common/GetTimesheetProjectsForPaginatedCombo"
+
 
 @click.group()
 @click.pass_context
@@ -21,7 +26,7 @@ def project(ctx):
     "-o",
     "--output",
     help="The format of the output of this command",
-    type=click.Choice(["json", "table"]),
+    type=click.Choice(["json", "ndjson", "csv", "table", "yaml"]),
     default="table",
 )
 @click.option(
@@ -34,12 +39,13 @@ def project(ctx):
 @click.option(
     "--query-text", "-q", help="Text to search for in the project name", default=""
 )
+@click.option("--refresh", help="Ignores the cached list of projects", is_flag=True)
 @click.pass_context
-def list_projects(ctx, output, client_id, all_projects, query_text):
+def list_projects(ctx, output, client_id, all_projects, query_text, refresh):
     """
     Lists the projects available for the given client
     """
-    get_projects(client_id if not all_projects else None, query_text, output)
+    get_projects(client_id if not all_projects else None, query_text, output, refresh)
 
 
 @click.command(name="select")
@@ -50,13 +56,18 @@ def list_projects(ctx, output, client_id, all_projects, query_text):
     default=lambda: environ.get("client_id", None),
 )
 @click.option("--all-projects", help="Ignore default selected client", is_flag=True)
+@click.option("--refresh", help="Ignores the cached list of projects", is_flag=True)
 @click.pass_context
-def project_select(ctx, client_id, all_projects):
+def project_select(ctx, client_id, all_projects, refresh):
     """
     Selects the project to use as default
     """
-    projects_list = get_projects(client_id if not all_projects else None, "", "python")
+    projects_list = get_projects(
+        client_id if not all_projects else None, "", "python", refresh
+    )
     if len(projects_list) > 1:
+        from pyfzf import FzfPrompt
+
         fzf = FzfPrompt()
         selected_dirty = fzf.prompt(
             [
@@ -71,36 +82,41 @@ def project_select(ctx, client_id, all_projects):
     click.echo("project " + selected + " selected as default!")
 
 
-def get_projects(client_id, query_text, output):
+def fetch_projects(client_id):
     config = get_config()
     body = {
         "isInModif": "false",
-        "queryText": query_text,
-        "start": 0,
-        "limit": 22,
+        "queryText": "",
         "employeeId": config["user_id"],
     }
 
     if client_id:
         body["clientId"] = client_id
-    projects = httprequest(
-        "get", body, "/Abak/Common/GetTimesheetProjectsForPaginatedCombo"
-    )
+    return list(paginate("GET", body, PROJECTS_PATH))
 
-    if output == "table":
-        headers = ["Id", "Display"]
-        table = tabulate(
-            [
-                [project[key] for key in project if key in headers]
-                for project in projects.get("data")
-            ],
-            headers=headers,
+
+def get_projects(client_id, query_text, output, refresh=False):
+    projects = {
+        "data": filter_catalog(
+            get_catalog(
+                PROJECTS_PATH,
+                lambda: fetch_projects(client_id),
+                client_id=client_id,
+                refresh=refresh,
+            ),
+            query_text,
+            ["Id", "Display"],
         )
-        print(table)
-    elif output == "json":
-        print(json.dumps(projects.get("data")))
-    elif output == "python":
+    }
+
+    if output == "python":
         return projects.get("data")
+    # The json, ndjson and yaml outputs keep every key of the projects
+    render(
+        projects.get("data"),
+        ["Id", "Display"] if output in ["table", "csv"] else None,
+        output,
+    )
 
 
 project.add_command(list_projects)
@@ -0,0 +1,166 @@
+import os
+import shlex
+import sys
+
+import click
+
+from fancy_abak.abak_shared_functions import get_config, error_message
+
+EXIT_COMMANDS = ["exit", "quit"]
+HISTORY_FILE = "shell_history"
+HISTORY_LENGTH = 1000
+
+
+def get_prompt():
+    context = get_config().get("current_context")
+    return f"abak ({context})> " if context else "abak> "
+
+
+def run_line(cli, line, environ=None):
+    """
+    Runs one line of the shell as the arguments of the abak command, in this process
+
+    Args:
+        cli (click.Group): the abak command
+        line (str): the arguments, quoted like in a shell, or a list of them
+        environ (dict): the environment of the command, the one of the process by default
+
+    Returns:
+        int: the exit code of the command
+    """
+    if isinstance(line, list):
+        arguments = line
+    else:
+        try:
+            arguments = shlex.split(line, comments=True)
+        except ValueError as error:
+            click.echo(f"Error: {error}", err=True)
+            return 2
+    if not arguments:
+        return 0
+    # abak fills the environment from the configuration with setdefault, each command
+    # starts from a copy so that it sees the configuration as it is now
+    saved = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(saved if environ is None else environ)
+    try:
+        return run_arguments(cli, arguments)
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def run_arguments(cli, arguments):
+    if arguments[0] == "shell":
+        click.echo("Error: the shell is already running", err=True)
+        return 2
+    try:
+        return cli.main(arguments, prog_name="abak", standalone_mode=False) or 0
+    except click.exceptions.Abort:
+        click.echo("Aborted!", err=True)
+    except click.exceptions.ClickException as error:
+        error.show()
+        return error.exit_code
+    except SystemExit as error:
+        return error.code if isinstance(error.code, int) else 1
+    except KeyboardInterrupt:
+        click.echo("Interrupted!", err=True)
+    except Exception as error:
+        click.echo(f"Error: {error_message(error)}", err=True)
+    return 1
+
+
+def get_completer(cli):
+    """
+    Completes the lines like the completion of the shell does for abak
+    """
+    from click.shell_completion import ShellComplete
+
+    completions = []
+
+    def complete(text, state):
+        import readline
+
+        if state == 0:
+            line = readline.get_line_buffer()[: readline.get_endidx()]
+            try:
+                arguments = shlex.split(line)
+            except ValueError:
+                arguments = line.split()
+            if arguments and not line.endswith(" "):
+                arguments.pop()
+            completions[:] = [
+                item.value
+                for item in ShellComplete(cli, {}, "abak", "").get_completions(
+                    arguments, text
+                )
+            ]
+        return completions[state] + " " if state < len(completions) else None
+
+    return complete
+
+
+def setup_readline(cli, history_path):
+    """
+    Adds the history of the previous sessions and the completion of the commands,
+    when the readline module is available
+    """
+    try:
+        import readline
+    except ImportError:
+        return False
+    try:
+        readline.read_history_file(history_path)
+    except OSError:
+        pass
+    readline.set_history_length(HISTORY_LENGTH)
+    readline.set_completer(get_completer(cli))
+    readline.set_completer_delims(" \t\n")
+    readline.parse_and_bind("tab: complete")
+    return True
+
+
+@click.command()
+@click.pass_context
+def shell(ctx):
+    """
+    Runs abak commands in a session that stays open, the connections, the
+    configuration and the catalogs are loaded once for all of them.
+
+    Type the commands without "abak", like "timesheet list", then "exit" or Ctrl-D to
+    leave. Commands are also read from the standard input, one per line.
+    """
+    cli = ctx.find_root().command
+    interactive = sys.stdin.isatty()
+    history_path = os.path.join(get_config()["app_dir"], HISTORY_FILE)
+    history = interactive and setup_readline(cli, history_path)
+    if interactive:
+        click.echo('Type "help" for the commands, "exit" or Ctrl-D to leave')
+
+    failed = 0
+    try:
+        while True:
+            try:
+                line = input(get_prompt()) if interactive else sys.stdin.readline()
+            except KeyboardInterrupt:
+                click.echo()
+                continue
+            except EOFError:
+                break
+            if not interactive and not line:
+                break
+            if line.strip() in EXIT_COMMANDS:
+                break
+            if line.strip() == "help":
+                line = "--help"
+            if run_line(cli, line):
+                failed += 1
+    finally:
+        if interactive:
+            click.echo()
+        if history:
+            import readline
+
+            readline.write_history_file(history_path)
+    if failed and not interactive:
+        ctx.exit(1)
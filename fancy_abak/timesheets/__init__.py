@@ -1 +1,2 @@
-from .timesheets import timesheet
\ No newline at end of file
+from .timesheets import timesheet
+from .totals import compute_totals, TOTALS_GROUPS
@@ -0,0 +1,139 @@
+from fancy_abak.abak_shared_functions import (
+    Sorry,
+    get_config,
+    httprequest,
+    paginate,
+    run_bulk,
+)
+
+from . import store
+from .transactions import resolve_entry_date
+
+APPROVE_PATH = "/Abak/Approval/ApproveRangeFromApprobation"
+UNAPPROVE_PATH = "/Abak/Approval/UnapproveRange"
+
+
+def read_employee_ids(employee_ids, employees_file=None):
+    """
+    Gathers the employees given on the command line and in a file with one ID per line,
+    where empty lines and lines starting with "#" are skipped
+
+    Returns:
+        list: the IDs without duplicates, in the order they were given
+    """
+    employee_ids = list(employee_ids)
+    if employees_file:
+        employee_ids += [
+            line.strip()
+            for line in employees_file
+            if line.strip() and not line.strip().startswith("#")
+        ]
+    return list(dict.fromkeys(employee_ids))
+
+
+def get_approvals(employee_id, start_date, end_date):
+    """
+    Gets every page of the timesheet entries of an employee waiting for approval
+
+    Args:
+        employee_id (str): the ID of the employee in Abak
+        start_date (str): first day, in the format of the config key "date_format", or
+            a weekday of the current week
+        end_date (str): last day, like start_date
+
+    Returns:
+        list: the entries of the range
+    """
+    config = get_config()
+    start_date = resolve_entry_date(start_date, config).strftime(config["date_format"])
+    end_date = resolve_entry_date(end_date, config).strftime(config["date_format"])
+    body = {
+        "MIME Type": "application/x-www-form-urlencoded; charset=UTF-8",
+        "employeeId": employee_id,
+        "groupBy": "Date",
+        "groupDir": "ASC",
+        "summaryFields": "TotalExpense",
+        "summaryTypes": "sum",
+        "sort": "Date",
+        "dir": "DESC",
+        "startDate": start_date + "T00:00:00",
+        "endDate": end_date + "T00:00:00",
+        "approvalType": "Timesheet",
+    }
+    return list(paginate("POST", body, "/Abak/Approval/GetApprovalsList", is_json=True))
+
+
+def get_approvals_for_employees(employee_ids, start_date, end_date, concurrency=4):
+    """
+    Gets the entries waiting for approval of several employees at the same time
+
+    Returns:
+        list: the results of run_bulk, the entries of each employee in "result"
+    """
+    results, _ = run_bulk(
+        employee_ids,
+        lambda employee_id: get_approvals(employee_id, start_date, end_date),
+        concurrency,
+    )
+    return results
+
+
+def set_approval(employee_id, start_date, end_date, remove=False):
+    """
+    Approves the timesheet of an employee over a range, or removes its approval. The
+    dates are checked before anything is sent, like in get_approvals.
+    """
+    config = get_config()
+    first_day = resolve_entry_date(start_date, config)
+    last_day = resolve_entry_date(end_date, config)
+    body = {
+        "MIME Type": "application/x-www-form-urlencoded; charset=UTF-8",
+        "approvalType": "Timesheet",
+        "employeeId": employee_id,
+        "startDate": first_day.strftime(config["date_format"]),
+        "endDate": last_day.strftime(config["date_format"]),
+    }
+    result = httprequest(
+        "POST", body, UNAPPROVE_PATH if remove else APPROVE_PATH, is_json=True
+    )
+    if isinstance(result, dict) and result.get("success") is False:
+        raise Sorry(result.get("message") or "Abak refused the approval")
+    if employee_id == config.get("user_id"):
+        store.mark_dirty(store.months_between(first_day, last_day), config=config)
+    return result
+
+
+def set_approvals(employee_ids, start_date, end_date, remove=False, concurrency=4):
+    """
+    Approves, or unapproves, the timesheets of several employees at the same time
+
+    Returns:
+        tuple: (results, summary) of run_bulk, one result per employee
+    """
+    return run_bulk(
+        employee_ids,
+        lambda employee_id: set_approval(employee_id, start_date, end_date, remove),
+        concurrency,
+    )
+
+
+def summarize_approvals(results):
+    """
+    Returns:
+        list: [employee, entries, hours, first day, last day, error] of each employee
+    """
+    rows = []
+    for result in results:
+        entries = result["result"] or []
+        days = sorted(entry["Date"][:10] for entry in entries)
+        rows.append(
+            [
+                result["item"],
+                len(entries),
+                sum(entry.get("Quantity") or 0 for entry in entries),
+                days[0] if days else "",
+                days[-1] if days else "",
+                result["error"] or "",
+            ]
+        )
+    return rows
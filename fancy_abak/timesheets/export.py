@@ -0,0 +1,139 @@
+import csv
+import sys
+
+from fancy_abak.abak_shared_functions import Sorry
+
+from .transactions import transaction_day
+from .totals import billable_quantity, get_price
+
+EXPORT_FORMATS = ["csv", "parquet", "arrow"]
+# Name and type of each column, the types are the ones of the Arrow schema
+EXPORT_COLUMNS = [
+    ("Id", "string"),
+    ("Date", "date32"),
+    ("ClientId", "string"),
+    ("ClientName", "string"),
+    ("ProjectId", "string"),
+    ("ProjectName", "string"),
+    ("Description", "string"),
+    ("Context", "string"),
+    ("Hours", "float64"),
+    ("Billable", "float64"),
+    ("Price", "float64"),
+    ("Amount", "float64"),
+    ("Approved", "bool_"),
+]
+
+
+def optional_string(value):
+    return None if value is None else str(value)
+
+
+def build_columns(transactions, resolve_context, contexts):
+    """
+    Converts the transactions to typed columns, with the context of each transaction,
+    the price of the hour of that context and what its billed hours amount to
+
+    Args:
+        transactions (list): transactions returned by GetGroupedTransacts
+        resolve_context (function): returns the context name of a transaction
+        contexts (dict): the contexts of the configuration
+
+    Returns:
+        dict: one list per column of EXPORT_COLUMNS, in the order of the transactions
+    """
+    columns = {name: [] for name, _ in EXPORT_COLUMNS}
+    for transaction in sorted(
+        transactions, key=lambda row: (row["Date"][:10], str(row["Id"]))
+    ):
+        context = resolve_context(transaction)
+        price = get_price(contexts, context)
+        hours = float(transaction.get("Quantity") or 0)
+        billable = float(billable_quantity(transaction))
+        columns["Id"].append(str(transaction["Id"]))
+        columns["Date"].append(transaction_day(transaction))
+        columns["ClientId"].append(optional_string(transaction.get("ClientId")))
+        columns["ClientName"].append(transaction.get("ClientName"))
+        columns["ProjectId"].append(optional_string(transaction.get("ProjectId")))
+        columns["ProjectName"].append(transaction.get("ProjectName"))
+        columns["Description"].append(transaction.get("Description"))
+        columns["Context"].append(context)
+        columns["Hours"].append(hours)
+        columns["Billable"].append(billable)
+        columns["Price"].append(price)
+        columns["Amount"].append(billable * price)
+        columns["Approved"].append(transaction.get("IsApproved"))
+    return columns
+
+
+def write_csv(columns, file):
+    """
+    Writes the columns as CSV, dates in ISO format and missing values left empty
+    """
+    names = [name for name, _ in EXPORT_COLUMNS]
+    writer = csv.writer(file, lineterminator="\n")
+    writer.writerow(names)
+    for row in zip(*[columns[name] for name in names]):
+        writer.writerow(
+            [
+                "" if value is None else value
+                for value in [row[0], row[1].isoformat(), *row[2:]]
+            ]
+        )
+
+
+def build_table(columns):
+    """
+    Returns:
+        pyarrow.Table: the columns with the types of EXPORT_COLUMNS
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise Sorry(
+            "the parquet and arrow formats need pyarrow, install it with "
+            "'pip install pyarrow'"
+        )
+    schema = pyarrow.schema(
+        [(name, getattr(pyarrow, type_name)()) for name, type_name in EXPORT_COLUMNS]
+    )
+    return pyarrow.Table.from_pydict(columns, schema=schema)
+
+
+def write_parquet(table, file):
+    import pyarrow.parquet
+
+    pyarrow.parquet.write_table(table, file)
+
+
+def write_arrow(table, file):
+    import pyarrow.ipc
+
+    with pyarrow.ipc.new_file(file, table.schema) as writer:
+        writer.write_table(table)
+
+
+def export_transactions(columns, export_format, path="-"):
+    """
+    Writes the columns built by build_columns to a file
+
+    Args:
+        columns (dict): the columns built by build_columns
+        export_format (str): one of EXPORT_FORMATS
+        path (str): the file to write, "-" writes to the standard output
+    """
+    if export_format == "csv":
+        if path == "-":
+            write_csv(columns, sys.stdout)
+        else:
+            with open(path, "w", newline="") as file:
+                write_csv(columns, file)
+        return
+    # Built before opening the file, to leave it alone when pyarrow is missing
+    table = build_table(columns)
+    writer = write_parquet if export_format == "parquet" else write_arrow
+    if path == "-":
+        writer(table, sys.stdout.buffer)
+    else:
+        with open(path, "wb") as file:
+            writer(table, file)
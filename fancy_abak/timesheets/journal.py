@@ -0,0 +1,264 @@
+import json
+import time
+from itertools import groupby
+
+from fancy_abak.abak_shared_functions import (
+    get_config,
+    run_bulk,
+    summarize,
+    error_message,
+)
+
+from . import store
+from .transactions import create_timesheet_entry, delete_timesheet_entries
+from .reconcile import DELETE_BATCH_SIZE, plan_timesheet_entries, execute_plan
+
+DEFAULT_FLUSH_RETRIES = 3
+DEFAULT_FLUSH_BACKOFF = 1.0
+ENTRY_KEYS = ["client_id", "project_id", "date", "description", "hours"]
+
+
+def enqueue(action, payloads, config=None):
+    """
+    Records timesheet writes in the journal of the local store, to be sent by flush
+
+    Args:
+        action (str): "set", "apply" or "delete"
+        payloads (list): one dict per operation, the arguments of the write
+
+    Returns:
+        list: the IDs of the operations in the journal
+    """
+    config = config or get_config()
+    with store.open_store(config) as connection:
+        return [
+            connection.execute(
+                "INSERT INTO queue (created_at, action, payload) VALUES (?, ?, ?)",
+                (time.time(), action, json.dumps(payload)),
+            ).lastrowid
+            for payload in payloads
+        ]
+
+
+def get_queued_operations(config=None):
+    """
+    Returns:
+        list: the operations waiting in the journal, oldest first
+    """
+    config = config or get_config()
+    with store.open_store(config) as connection:
+        return [
+            {
+                "id": operation_id,
+                "action": action,
+                "payload": json.loads(payload),
+                "attempts": attempts,
+                "error": error,
+            }
+            for operation_id, action, payload, attempts, error in connection.execute(
+                "SELECT id, action, payload, attempts, error FROM queue ORDER BY id"
+            )
+        ]
+
+
+def record_results(results, config=None):
+    """
+    Removes the operations that were sent from the journal, and keeps the error of the
+    others for the next flush
+    """
+    config = config or get_config()
+    with store.open_store(config) as connection:
+        connection.executemany(
+            "DELETE FROM queue WHERE id = ?",
+            [(result["item"]["id"],) for result in results if not result["error"]],
+        )
+        connection.executemany(
+            "UPDATE queue SET attempts = ?, error = ? WHERE id = ?",
+            [
+                (result["item"]["attempts"], result["error"], result["item"]["id"])
+                for result in results
+                if result["error"]
+            ],
+        )
+
+
+def find_sent_sets(operations):
+    """
+    Looks in Abak for the entries of sets that were sent before, which may have been
+    created even though they failed, like when the response was lost
+
+    Returns:
+        dict: {operation ID: {"result", "error"}} of the sets that must not be sent
+    """
+    if not operations:
+        return {}
+    entries = [
+        {
+            **{key: operation["payload"][key] for key in ENTRY_KEYS},
+            "queue_id": operation["id"],
+        }
+        for operation in operations
+    ]
+    try:
+        plan = plan_timesheet_entries(entries)
+    except Exception as error:
+        return {
+            operation["id"]: {"result": None, "error": error_message(error)}
+            for operation in operations
+        }
+    # An entry with other hours is not the one of the set, it is created next to it
+    return {
+        item["queue_id"]: {
+            "result": item["id"] or None,
+            "error": item.get("error") if item["action"] == "invalid" else None,
+        }
+        for item in plan
+        if item["action"] in ["unchanged", "invalid"]
+    }
+
+
+def send_sets(operations, concurrency):
+    # Only the sets sent before are compared with Abak, a set never sent can't be there
+    # yet and may be a second entry identical to one that is
+    found = find_sent_sets(
+        [operation for operation in operations if operation["attempts"] > 1]
+    )
+    results, _ = run_bulk(
+        [operation for operation in operations if operation["id"] not in found],
+        lambda operation: create_timesheet_entry(
+            **{key: operation["payload"][key] for key in ENTRY_KEYS}
+        ),
+        concurrency=concurrency,
+    )
+    return results + [
+        {"item": operation, **found[operation["id"]], "latency": 0}
+        for operation in operations
+        if operation["id"] in found
+    ]
+
+
+def send_applies(operations, concurrency):
+    # The entries are reconciled with what is already in Abak, so sending them again
+    # after a failure never duplicates them
+    results = []
+    for prune in [False, True]:
+        batch = [
+            operation
+            for operation in operations
+            if operation["payload"].get("prune", False) == prune
+        ]
+        if not batch:
+            continue
+        entries = [
+            {
+                **{key: operation["payload"][key] for key in ENTRY_KEYS},
+                "queue_id": operation["id"],
+            }
+            for operation in batch
+        ]
+        try:
+            plan_results, _ = execute_plan(
+                plan_timesheet_entries(entries, prune), concurrency
+            )
+        except Exception as error:
+            plan_results = [
+                {"item": entry, "result": None, "error": error_message(error)}
+                for entry in entries
+            ]
+        sent = {result["item"].get("queue_id"): result for result in plan_results}
+        for operation in batch:
+            result = sent.get(operation["id"])
+            results.append(
+                {
+                    "item": operation,
+                    "result": result["result"] if result else "unchanged",
+                    "error": result["error"] if result else None,
+                    "latency": result.get("latency", 0) if result else 0,
+                }
+            )
+    return results
+
+
+def send_deletes(operations, concurrency):
+    batches = [
+        operations[index : index + DELETE_BATCH_SIZE]
+        for index in range(0, len(operations), DELETE_BATCH_SIZE)
+    ]
+    batch_results, _ = run_bulk(
+        batches,
+        lambda batch: delete_timesheet_entries(
+            [operation["payload"]["id"] for operation in batch]
+        ),
+        concurrency=concurrency,
+    )
+    return [
+        {
+            **result,
+            "item": operation,
+            "result": None if result["error"] else operation["payload"]["id"],
+        }
+        for result in batch_results
+        for operation in result["item"]
+    ]
+
+
+SENDERS = {"set": send_sets, "apply": send_applies, "delete": send_deletes}
+
+
+def flush_queue(
+    concurrency=4,
+    retries=DEFAULT_FLUSH_RETRIES,
+    backoff=DEFAULT_FLUSH_BACKOFF,
+):
+    """
+    Sends the operations of the journal to Abak, retrying the failed ones with an
+    exponential backoff
+
+    Args:
+        concurrency (int): maximum number of requests sent at the same time
+        retries (int): number of times the failed operations are sent again
+        backoff (float): seconds before the first retry, doubled at each retry
+
+    Returns:
+        tuple: (results, summary) with the last result of each operation
+    """
+    started = time.perf_counter()
+    pending = get_queued_operations()
+    final = {}
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        results = []
+        # The operations are sent in the order they were queued, each run of the same
+        # action together: sets in bulk, applies in one plan, deletions in batches
+        for (action, _), run in groupby(
+            pending,
+            key=lambda operation: (
+                operation["action"],
+                operation["payload"].get("prune", False),
+            ),
+        ):
+            operations = [
+                {**operation, "attempts": operation["attempts"] + 1}
+                for operation in run
+            ]
+            results.extend(SENDERS[action](operations, concurrency))
+        record_results(results)
+        final.update({result["item"]["id"]: result for result in results})
+        pending = sorted(
+            (result["item"] for result in results if result["error"]),
+            key=lambda operation: operation["id"],
+        )
+        if not pending:
+            break
+    results = [final[operation_id] for operation_id in sorted(final)]
+    return results, summarize(results, time.perf_counter() - started)
+
+
+def discard_operations(operation_ids, config=None):
+    config = config or get_config()
+    with store.open_store(config) as connection:
+        connection.executemany(
+            "DELETE FROM queue WHERE id = ?",
+            [(operation_id,) for operation_id in operation_ids],
+        )
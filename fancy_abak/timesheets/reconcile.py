@@ -0,0 +1,284 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from fancy_abak.abak_shared_functions import (
+    Sorry,
+    get_config,
+    option_not_none,
+    run_bulk,
+    summarize,
+    error_message,
+)
+
+from fancy_abak.project import get_projects
+
+from .transactions import (
+    validate_entry_date,
+    validate_description,
+    create_timesheet_entry,
+    get_transactions,
+    delete_timesheet_entries,
+    transaction_day,
+)
+
+DELETE_BATCH_SIZE = 50
+
+
+def plan_range_queries(days):
+    """
+    Picks the GetGroupedTransacts queries that cover all the given days with the fewest requests.
+    Weekly queries are only used for days from Monday to Saturday, which fall in the same
+    week whether Abak starts its weeks on Sunday or on Monday.
+
+    Args:
+        days (set): datetime.date objects to cover
+
+    Returns:
+        list: (datetime.date, range) tuples to query
+    """
+    months = {}
+    for day in days:
+        months.setdefault((day.year, day.month), set()).add(day)
+    queries = []
+    for month_days in months.values():
+        weeks = {day - timedelta(days=day.weekday()) for day in month_days}
+        if len(weeks) == 1 and all(day.weekday() < 6 for day in month_days):
+            queries.append((min(month_days), "Weekly"))
+        else:
+            queries.append((min(month_days), "Monthly"))
+    return sorted(queries)
+
+
+def get_transactions_for_days(days, concurrency=4):
+    """
+    Gets the transactions of the given days, fetching the ranges that contain them concurrently
+
+    Returns:
+        list: the transactions of those days, without duplicates
+    """
+    config = get_config()
+    queries = plan_range_queries(days)
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        pages = executor.map(
+            lambda query: get_transactions(
+                query[0].strftime(config["date_format"]), query[1]
+            ),
+            queries,
+        )
+        transactions = {}
+        for page in pages:
+            for row in page:
+                if transaction_day(row) in days:
+                    transactions[row["Id"]] = row
+    return list(transactions.values())
+
+
+def build_project_ids_by_name():
+    """
+    Indexes the IDs of the projects by their display name, and by its first 60
+    characters, for the transactions Abak sends without ProjectId. Names shared by
+    several projects are left out.
+    """
+    ids = {}
+    for project in get_projects(None, "", "python"):
+        for name in {project["Display"], project["Display"][0:60]}:
+            ids.setdefault(name, set()).add(str(project["Id"]))
+    return {name: found.pop() for name, found in ids.items() if len(found) == 1}
+
+
+def row_project_id(row, project_ids_by_name):
+    """
+    Returns:
+        str: the ID of the project of a transaction, None when it can't be told
+    """
+    if row.get("ProjectId") is not None:
+        return str(row["ProjectId"])
+    name = row.get("ProjectName") or ""
+    return project_ids_by_name.get(name) or project_ids_by_name.get(name[0:60])
+
+
+def same_assignment(row, entry, project_ids_by_name={}):
+    # A transaction whose project can't be told never matches, updating it could move
+    # the entry of another project. The client is only compared when Abak sent it.
+    if row_project_id(row, project_ids_by_name) != str(entry["project_id"]):
+        return False
+    return row.get("ClientId") is None or str(row["ClientId"]) == str(
+        entry["client_id"]
+    )
+
+
+def validate_entry(entry, config):
+    """
+    Checks an entry of an apply file without contacting Abak
+
+    Returns:
+        datetime.date: the day of the entry
+    """
+    validate_entry_date(None, None, entry["date"])
+    validate_description(None, None, entry["description"])
+    option_not_none("client id", entry["client_id"])
+    option_not_none("project id", entry["project_id"])
+    float(entry["hours"])
+    return datetime.strptime(entry["date"], config["date_format"]).date()
+
+
+def plan_timesheet_entries(entries, prune=False):
+    """
+    Compares the entries of an apply file with what is already in Abak for their dates
+
+    Args:
+        entries (list): dicts with the keys client_id, project_id, date, description and hours
+        prune (bool): also plans the deletion of the entries of the same dates and projects
+            that are not in the file
+
+    Returns:
+        list: the entries with an "action" key ("create", "update", "unchanged", "delete"
+            or "invalid") and the "id" of the matching transaction
+    """
+    config = get_config()
+    plan = []
+    desired = []
+    for entry in entries:
+        try:
+            day = validate_entry(entry, config)
+        except (Sorry, ValueError, TypeError) as error:
+            plan.append(
+                {**entry, "action": "invalid", "id": "", "error": error_message(error)}
+            )
+            continue
+        desired.append({**entry, "day": day})
+
+    existing = get_transactions_for_days({entry["day"] for entry in desired})
+    project_ids_by_name = (
+        build_project_ids_by_name()
+        if any(row.get("ProjectId") is None for row in existing)
+        else {}
+    )
+    candidates = {}
+    for row in existing:
+        candidates.setdefault(
+            (transaction_day(row), row.get("Description")), []
+        ).append(row)
+
+    matched = set()
+    for entry in desired:
+        row = next(
+            (
+                row
+                for row in candidates.get((entry["day"], entry["description"]), [])
+                if row["Id"] not in matched
+                and same_assignment(row, entry, project_ids_by_name)
+            ),
+            None,
+        )
+        if row is None:
+            plan.append({**entry, "action": "create", "id": ""})
+            continue
+        matched.add(row["Id"])
+        unchanged = float(row.get("Quantity", 0)) == float(entry["hours"])
+        plan.append(
+            {**entry, "action": "unchanged" if unchanged else "update", "id": row["Id"]}
+        )
+
+    if prune:
+        projects = {str(entry["project_id"]) for entry in desired}
+        for row in existing:
+            # Only the rows known to belong to the projects of the file are deleted
+            if (
+                row["Id"] in matched
+                or row_project_id(row, project_ids_by_name) not in projects
+            ):
+                continue
+            plan.append(
+                {
+                    "client_id": row.get("ClientId", ""),
+                    "project_id": row.get("ProjectId", row.get("ProjectName", "")),
+                    "date": transaction_day(row).strftime(config["date_format"]),
+                    "description": row.get("Description"),
+                    "hours": row.get("Quantity"),
+                    "action": "delete",
+                    "id": row["Id"],
+                }
+            )
+    return plan
+
+
+def apply_plan_item(item):
+    if item["action"] == "delete":
+        delete_timesheet_entries([deletion["id"] for deletion in item["deletions"]])
+        return None
+    return create_timesheet_entry(
+        item["client_id"],
+        item["project_id"],
+        item["date"],
+        item["description"],
+        item["hours"],
+        timesheet_id=item["id"],
+    )
+
+
+def execute_plan(plan, concurrency=4, rate_limit=0):
+    """
+    Creates and updates the planned entries concurrently and deletes the others in batches
+
+    Returns:
+        tuple: (results, summary) with one result per entry of the plan that needed a change
+    """
+    operations = [item for item in plan if item["action"] in ["create", "update"]]
+    deletions = [item for item in plan if item["action"] == "delete"]
+    for index in range(0, len(deletions), DELETE_BATCH_SIZE):
+        operations.append(
+            {
+                "action": "delete",
+                "deletions": deletions[index : index + DELETE_BATCH_SIZE],
+            }
+        )
+
+    bulk_results, bulk_summary = run_bulk(
+        operations, apply_plan_item, concurrency=concurrency, rate_limit=rate_limit
+    )
+    results = [
+        {"item": item, "result": None, "error": item["error"], "latency": 0}
+        for item in plan
+        if item["action"] == "invalid"
+    ]
+    for result in bulk_results:
+        if result["item"]["action"] != "delete":
+            results.append(result)
+            continue
+        for deletion in result["item"]["deletions"]:
+            results.append(
+                {
+                    **result,
+                    "item": deletion,
+                    "result": None if result["error"] else deletion["id"],
+                }
+            )
+    return results, summarize(results, bulk_summary["elapsed"])
+
+
+def delete_in_batches(timesheet_ids, concurrency=4):
+    """
+    Deletes timesheet entries with one DeleteTransacts request per DELETE_BATCH_SIZE
+    entries, the requests being sent concurrently
+
+    Returns:
+        tuple: (results, summary) with one result per entry, its ID in "item"
+    """
+    batches = [
+        timesheet_ids[index : index + DELETE_BATCH_SIZE]
+        for index in range(0, len(timesheet_ids), DELETE_BATCH_SIZE)
+    ]
+    batch_results, batch_summary = run_bulk(
+        batches, delete_timesheet_entries, concurrency=concurrency
+    )
+    results = [
+        {
+            **result,
+            "item": timesheet_id,
+            "result": None if result["error"] else timesheet_id,
+        }
+        for result in batch_results
+        for timesheet_id in result["item"]
+    ]
+    return results, summarize(results, batch_summary["elapsed"])
@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+
+from fancy_abak.abak_shared_functions import Sorry, get_config
+
+
+def validate_report_date(ctx, param, value):
+    if value is None:
+        return None
+    config = get_config()
+    try:
+        return datetime.strptime(value, config["date_format"]).date()
+    except (TypeError, ValueError):
+        raise Sorry(f"date needs to be in the format {config['date_format']}")
+
+
+def days_between(first_day, last_day):
+    """
+    Returns:
+        set: every datetime.date from first_day to last_day, both included
+    """
+    if last_day < first_day:
+        raise Sorry("the end of the report must be after its start")
+    return {
+        first_day + timedelta(days=offset)
+        for offset in range((last_day - first_day).days + 1)
+    }
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from fancy_abak.abak_shared_functions import get_config
+
+DEFAULT_SYNC_GRACE_DAYS = 7
+DEFAULT_SYNC_MONTHS = 12
+# Even a closed month can be changed in Abak by a manager, it is checked again after
+DEFAULT_STORE_TTL = 86400
+# Key of the transactions telling if they were approved, a month where every
+# transaction is approved can't change anymore
+APPROVED_KEY = "IsApproved"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    month TEXT NOT NULL,
+    day TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_day ON transactions (day);
+CREATE TABLE IF NOT EXISTS months (
+    month TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL,
+    entries INTEGER NOT NULL,
+    closed INTEGER NOT NULL,
+    dirty INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    action TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+"""
+
+
+def is_store_enabled(config):
+    return str(config.get("transaction_store", "on")).lower() not in [
+        "off",
+        "false",
+        "no",
+        "0",
+    ]
+
+
+def store_file_path(config):
+    """
+    Returns the SQLite file of the transactions, one per endpoint and employee
+    """
+    key = json.dumps([config.get("endpoint"), config.get("user_id")])
+    return os.path.join(
+        config["app_dir"],
+        "store",
+        hashlib.sha1(key.encode()).hexdigest() + ".sqlite3",
+    )
+
+
+@contextmanager
+def open_store(config):
+    """
+    Opens the store in a transaction, committed when the block ends without error
+    """
+    file_path = store_file_path(config)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    connection = sqlite3.connect(file_path, timeout=30)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def month_key(day):
+    return day.strftime("%Y-%m")
+
+
+def month_bounds(month):
+    first = datetime.strptime(month, "%Y-%m").date()
+    following = (first + timedelta(days=32)).replace(day=1)
+    return first, following - timedelta(days=1)
+
+
+def months_between(first_day, last_day):
+    """
+    Returns:
+        set: the months ("YYYY-MM") from first_day to last_day
+    """
+    return {
+        month_key(first_day + timedelta(days=offset))
+        for offset in range((last_day - first_day).days + 1)
+    }
+
+
+def candidate_ranges(day, query_range):
+    """
+    Returns the (first, last) days GetGroupedTransacts may return for a query. Abak
+    starts its weeks on Sunday or on Monday depending on its configuration, so a
+    weekly query has two candidates.
+    """
+    if query_range == "Daily":
+        return [(day, day)]
+    if query_range == "Monthly":
+        return [month_bounds(month_key(day))]
+    sunday = day - timedelta(days=(day.weekday() + 1) % 7)
+    monday = day - timedelta(days=day.weekday())
+    return [(sunday, sunday + timedelta(days=6)), (monday, monday + timedelta(days=6))]
+
+
+def is_month_closed(month, rows, config):
+    """
+    A month is closed once it ended more than "sync_grace_days" ago and Abak says that
+    every one of its transactions is approved. An empty month, or transactions without
+    the approval flag, may still change and stay open.
+    """
+    try:
+        grace = int(config.get("sync_grace_days", DEFAULT_SYNC_GRACE_DAYS))
+    except ValueError:
+        grace = DEFAULT_SYNC_GRACE_DAYS
+    if month_bounds(month)[1] >= date.today() - timedelta(days=grace):
+        return False
+    return bool(rows) and all(row.get(APPROVED_KEY) is True for row in rows)
+
+
+def get_store_ttl(config):
+    try:
+        return float(config.get("store_ttl", DEFAULT_STORE_TTL))
+    except (TypeError, ValueError):
+        return DEFAULT_STORE_TTL
+
+
+def save_month(month, rows, config=None):
+    """
+    Replaces the stored transactions of a month with the ones of a Monthly query
+    """
+    config = config or get_config()
+    with open_store(config) as connection:
+        connection.execute("DELETE FROM transactions WHERE month = ?", (month,))
+        connection.executemany(
+            "INSERT OR REPLACE INTO transactions (id, month, day, data) VALUES (?, ?, ?, ?)",
+            [
+                (str(row["Id"]), month, row["Date"][:10], json.dumps(row))
+                for row in rows
+            ],
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO months (month, synced_at, entries, closed, dirty) "
+            "VALUES (?, ?, ?, ?, 0)",
+            (month, time.time(), len(rows), is_month_closed(month, rows, config)),
+        )
+
+
+def read_ranges(ranges, config=None):
+    """
+    Reads the transactions of a query from the store, when all its months are closed,
+    haven't changed since they were synced and were synced less than "store_ttl" config
+    key (seconds) ago
+
+    Args:
+        ranges (list): the candidate (first, last) days of the query
+
+    Returns:
+        list: the transactions, or None if the query needs to go to Abak
+    """
+    config = config or get_config()
+    if not is_store_enabled(config):
+        return None
+    first = min(start for start, end in ranges)
+    last = max(end for start, end in ranges)
+    months = months_between(first, last)
+    with open_store(config) as connection:
+        stored = connection.execute(
+            f"SELECT COUNT(*) FROM months WHERE closed = 1 AND dirty = 0 "
+            f"AND synced_at >= ? AND month IN ({', '.join('?' for _ in months)})",
+            [time.time() - get_store_ttl(config)] + sorted(months),
+        ).fetchone()[0]
+        if stored != len(months):
+            return None
+        rows = [
+            json.loads(data)
+            for (data,) in connection.execute(
+                "SELECT data FROM transactions WHERE day BETWEEN ? AND ? ORDER BY day, id",
+                (first.isoformat(), last.isoformat()),
+            )
+        ]
+
+    found = [
+        [
+            row
+            for row in rows
+            if start.isoformat() <= row["Date"][:10] <= end.isoformat()
+        ]
+        for start, end in ranges
+    ]
+    # The candidates only differ on the days at their edges, when nothing was recorded
+    # on those days they all give the same answer
+    if any(
+        [row["Id"] for row in candidate] != [row["Id"] for row in found[0]]
+        for candidate in found
+    ):
+        return None
+    return found[0]
+
+
+def changed_file_path(config):
+    return os.path.join(config["app_dir"], "store", "changed")
+
+
+def last_change(config=None):
+    """
+    Returns:
+        float: when the CLI last changed transactions in Abak, as a timestamp, 0 if never
+    """
+    config = config or get_config()
+    try:
+        return os.stat(changed_file_path(config)).st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def mark_dirty(months=[], transaction_ids=[], config=None):
+    """
+    Marks the months changed by the CLI, so that they are fetched again from Abak
+    """
+    config = config or get_config()
+    # Tells the processes keeping transactions in memory, like the daemon, that they
+    # changed, even when the store is off
+    file_path = changed_file_path(config)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "a"):
+        os.utime(file_path)
+    if not is_store_enabled(config):
+        return
+    with open_store(config) as connection:
+        months = set(months)
+        if transaction_ids:
+            months.update(
+                month
+                for (month,) in connection.execute(
+                    f"SELECT month FROM transactions WHERE id IN "
+                    f"({', '.join('?' for _ in transaction_ids)})",
+                    [str(transaction_id) for transaction_id in transaction_ids],
+                )
+            )
+        connection.executemany(
+            "UPDATE months SET dirty = 1 WHERE month = ?",
+            [(month,) for month in months],
+        )
+
+
+def get_months(config=None):
+    """
+    Returns:
+        dict: {month: {"synced_at", "entries", "closed", "dirty"}} of the stored months
+    """
+    config = config or get_config()
+    with open_store(config) as connection:
+        months = {
+            month: {
+                "synced_at": synced_at,
+                "entries": entries,
+                "closed": bool(closed),
+                "dirty": bool(dirty),
+            }
+            for month, synced_at, entries, closed, dirty in connection.execute(
+                "SELECT month, synced_at, entries, closed, dirty FROM months"
+            )
+        }
+    return months
+
+
+def months_to_sync(months_back=DEFAULT_SYNC_MONTHS, full=False, config=None):
+    """
+    Picks the months "timesheet sync" fetches again: the ones never synced, still open,
+    changed by the CLI since they were synced, or synced more than "store_ttl" ago
+
+    Args:
+        months_back (int): number of months before the current one to keep in the store
+        full (bool): fetches every month again
+
+    Returns:
+        list: the months ("YYYY-MM") to fetch, oldest first
+    """
+    config = config or get_config()
+    stored = get_months(config)
+    expired = time.time() - get_store_ttl(config)
+    first = date.today().replace(day=1)
+    months = []
+    for _ in range(months_back + 1):
+        months.append(month_key(first))
+        first = (first - timedelta(days=1)).replace(day=1)
+    return sorted(
+        month
+        for month in months
+        if full
+        or month not in stored
+        or not stored[month]["closed"]
+        or stored[month]["dirty"]
+        or stored[month]["synced_at"] < expired
+    )
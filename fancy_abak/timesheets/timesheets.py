@@ -1,8 +1,5 @@
-from fancy_abak.abak_shared_functions.requests_functions import httprequest
 import click
-import re
 import json
-import yaml
 from tabulate import tabulate
 
 from datetime import datetime, timedelta
@@ -12,13 +9,55 @@ from os import environ
 from fancy_abak.abak_shared_functions import (
     Sorry,
     get_config,
+    update_config,
     option_not_none,
+    error_message,
     generate_bs,
-    get_date_format_from_abak,
+    format_summary,
+    is_catalog_fresh,
+    run_bulk,
+    render,
+    OUTPUT_FORMATS,
 )
 
 from fancy_abak.abak_context import get_contexts
-from fancy_abak.project import get_projects
+from fancy_abak.project import get_projects, PROJECTS_PATH
+
+from .transactions import (
+    validate_entry_date,
+    resolve_entry_date,
+    validate_description,
+    create_timesheet_entry,
+    get_transactions,
+    get_context_resolver,
+    filter_transactions,
+    sync_month,
+)
+from . import store
+from .reconcile import (
+    plan_timesheet_entries,
+    execute_plan,
+    get_transactions_for_days,
+    validate_entry,
+    delete_in_batches,
+)
+from .journal import (
+    DEFAULT_FLUSH_RETRIES,
+    DEFAULT_FLUSH_BACKOFF,
+    enqueue,
+    get_queued_operations,
+    discard_operations,
+    flush_queue,
+)
+from .report import validate_report_date, days_between
+from .totals import TOTALS_GROUPS, TOTALS_ENGINES, compute_totals, group_value
+from .export import EXPORT_FORMATS, build_columns, export_transactions
+from .approvals import (
+    read_employee_ids,
+    get_approvals_for_employees,
+    set_approvals,
+    summarize_approvals,
+)
 
 
 @click.group()
@@ -30,38 +69,6 @@ def timesheet(ctx):
     pass
 
 
-def validate_entry_date(ctx, param, value):
-    if not value:
-        return None
-    config = get_config()
-    if value.upper() in [
-        "MONDAY",
-        "TUESDAY",
-        "WEDNESDAY",
-        "THURSDAY",
-        "FRIDAY",
-        "SATURDAY",
-        "SUNDAY",
-    ]:
-        return value
-    try:
-        datetime.strptime(value, config["date_format"])
-        return value
-    except:
-        raise Sorry(f"date needs to be in the format {config['date_format']}")
-
-
-def validate_description(ctx, param, value):
-    if not value:
-        raise Sorry("description ('--description', '-d') is a required parameter")
-    elif len(value) <= 100:
-        return value
-    else:
-        raise Sorry(
-            "description of the timesheet entry must not be larger than 100 characters"
-        )
-
-
 @click.command(name="list")
 @click.pass_context
 @click.option(
@@ -75,9 +82,15 @@ def validate_description(ctx, param, value):
     "-o",
     "--output",
     help="The output type you want",
-    type=click.Choice(["json", "table", "wide", "yaml", "yml"]),
+    type=click.Choice(["json", "ndjson", "csv", "table", "wide", "yaml", "yml"]),
     default="table",
 )
+@click.option(
+    "--page-size",
+    help="Number of rows of each table, 0 shows a single table",
+    type=click.IntRange(min=0),
+    default=0,
+)
 @click.option(
     "--query-range",
     "-r",
@@ -96,25 +109,66 @@ def validate_description(ctx, param, value):
 )
 @click.argument("context-filter", required=False)
 def timesheet_list(
-    ctx, date, output, query_range, show_totals, show_id, previous, context_filter
+    ctx,
+    date,
+    output,
+    page_size,
+    query_range,
+    show_totals,
+    show_id,
+    previous,
+    context_filter,
 ):
     """
     Lists the timesheet entries in ABAK
     """
     list_timesheet_entries(
-        date, output, query_range, show_totals, show_id, previous, context_filter
+        date,
+        output,
+        query_range,
+        show_totals,
+        show_id,
+        previous,
+        context_filter,
+        page_size,
     )
 
 
+def format_transaction(transaction, headers, output_format, resolve_context, config):
+    instance = []
+    for header in headers:
+        if header == "Weekday":
+            date_text = transaction[output_format.get(header)][:10]
+            date_instance = datetime.strptime(date_text, config["date_format"])
+            instance.append(date_instance.strftime("%A"))
+        elif header == "Context":
+            instance.append(
+                resolve_context(transaction) or transaction[output_format[header]]
+            )
+        else:
+            instance.append(
+                transaction[output_format.get(header)]
+                if header != "Date"
+                else transaction[output_format.get(header)][:10]
+            )
+    return instance
+
+
 def list_timesheet_entries(
-    date, output, query_range, show_totals, show_id, previous, context_filter
+    date,
+    output,
+    query_range,
+    show_totals,
+    show_id,
+    previous,
+    context_filter,
+    page_size=0,
 ):
     config = get_config()
 
     if not date:
         date = datetime.strftime(datetime.now(), format=config["date_format"])
 
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
     if previous:
         # click.echo(date)
         date_datetime = datetime.strptime(date, config["date_format"])
@@ -127,31 +181,33 @@ def list_timesheet_entries(
         )
         date = datetime.strftime(date_datetime - delta, format=config["date_format"])
         # click.echo(date)
-    body = {
-        "groupBy": "TransactType",
-        "groupDir": "ASC",
-        "summaryFields": "Quantity",
-        "summaryTypes": "sum",
-        "sort": "Date",
-        "dir": "ASC",
-        "employe": config["user_id"],
-        "date": date + "T00:00:00",
-        "range": query_range,
-    }
-
-    output_value = httprequest(
-        "POST", body, "/Abak/Transact/GetGroupedTransacts", headers=headers
-    )
-    transactions_to_clean = output_value.get("data")
-    projects_clean = get_projects(None, "", "python")
-    project_map = {}
     contexts = get_contexts()
-    for project in projects_clean:
-        project_cons = project["Display"][0:60]
-        for context in contexts:
-            if project["Id"] == contexts[context]["Project"]:
-                project_map[project_cons] = context
-                continue
+    # When Abak leaves the project ids out of the transactions, the projects are needed
+    # to resolve the contexts by name, so they are fetched while waiting for the
+    # transactions instead of after them
+    if (
+        contexts
+        and not config.get("transaction_project_ids")
+        and not is_catalog_fresh(PROJECTS_PATH)
+    ):
+        from fancy_abak.abak_shared_functions import run_concurrently
+
+        transactions_to_clean, _ = run_concurrently(
+            (get_transactions, date, query_range),
+            (get_projects, None, "", "python"),
+        )
+    else:
+        transactions_to_clean = get_transactions(date, query_range)
+    if transactions_to_clean:
+        update_config(
+            {
+                "transaction_project_ids": all(
+                    transaction.get("ProjectId") is not None
+                    for transaction in transactions_to_clean
+                )
+            }
+        )
+    resolve_context = get_context_resolver(transactions_to_clean, contexts)
 
     if context_filter:
         if context_filter not in [context for context in contexts]:
@@ -161,40 +217,38 @@ def list_timesheet_entries(
         transactions = [
             transaction
             for transaction in transactions_to_clean
-            if context_filter == project_map.get(transaction.get("ProjectName")[0:60])
+            if context_filter == resolve_context(transaction)
         ]
     else:
         transactions = transactions_to_clean
 
     if show_totals:
         date_datetime = datetime.strptime(date, config["date_format"])
-        totals = {}
-        for row in transactions:
-            totals[row["ProjectName"]] = totals.get(row["ProjectName"], 0) + row.get(
-                "Quantity", 0
-            )
-        totals["TOTAL"] = sum([totals[total] for total in totals])
         headers = ["Context", "Quanty", "Hour Price"]
-        rows = []
-        total_price = 0
-        for total in totals:
-            if total != "TOTAL":
-                rows.append(
-                    [
-                        project_map.get(total[0:60], "Context Unassigned"),
-                        totals[total],
-                        str(
-                            contexts.get(
-                                project_map.get(total[0:60]), {"Price": 0}
-                            ).get("Price", 0)
-                        ),
-                    ]
-                )
-                total_price += totals.get(total) * contexts.get(
-                    project_map.get(total[0:60]), {"Price": 0}
-                ).get("Price", 0)
-            else:
-                rows.append([total, totals[total], str(total_price)])
+        totals = compute_totals(
+            transactions, resolve_context, contexts, ["project", "context"]
+        )[:-1]
+        # In the order the projects first appear, like the entries
+        first_seen = {}
+        for row in transactions:
+            first_seen.setdefault(group_value(row, None, "project"), len(first_seen))
+        totals.sort(key=lambda total: first_seen[total["Project"]])
+        prices = [
+            contexts.get(total["Context"], {"Price": 0}).get("Price", 0)
+            for total in totals
+        ]
+        # One row per project, the TOTAL row shows the amount instead of a price. Unlike
+        # the report, every hour is billed, billable or not.
+        rows = [
+            [total["Context"], total["Hrs"], str(price)]
+            for total, price in zip(totals, prices)
+        ] + [
+            [
+                "TOTAL",
+                sum(total["Hrs"] for total in totals),
+                str(sum(total["Hrs"] * price for total, price in zip(totals, prices))),
+            ]
+        ]
     else:
         output_format = {
             "Weekday": "Date",
@@ -210,72 +264,32 @@ def list_timesheet_entries(
         if show_id:
             output_format["ID"] = "Id"
         headers = [header for header in output_format]
-        rows = []
-        for row in transactions:
-            instance = []
-            for header in headers:
-                if header == "Weekday":
-                    date_text = row[output_format.get(header)].split("T00")[0]
-                    date_instance = datetime.strptime(date_text, config["date_format"])
-                    instance.append(date_instance.strftime("%A"))
-                elif header == "Context":
-                    instance.append(
-                        project_map.get(
-                            row[output_format[header]][0:60], row[output_format[header]]
-                        )
-                    )
-                else:
-                    instance.append(
-                        row[output_format.get(header)]
-                        if header != "Date"
-                        else row[output_format.get(header)].split("T00")[0]
-                    )
-            rows.append(instance)
-    if output in ["json", "yaml", "yml"]:
-        out_array = []
-        for row in rows:
-            object_dict = {}
-            for i, header in enumerate(headers):
-                object_dict[header] = row[i]
-            out_array.append(object_dict)
-        if output in ["yaml", "yml"]:
-            print(yaml.dump(out_array))
-        else:
-            print(json.dumps(out_array))
-    elif output in ["table", "wide"]:
-        if show_totals:
-            click.echo(
-                "For the "
-                + (
-                    f"month of {calendar.month_name[date_datetime.month]}"
-                    if query_range == "Monthly"
-                    else "day of " + date
-                    if query_range == "Daily"
-                    else "week of " + date
-                )
-                + ", here are the totals:"
-            )
-        print(tabulate(rows, headers=headers, numalign="left"))
-    elif output == "python":
+        # The rows are formatted while they are written
+        rows = (
+            format_transaction(row, headers, output_format, resolve_context, config)
+            for row in transactions
+        )
+    if output == "python":
         return transactions
-
-
-def convert_date(text):
-    start = text.find("new Date")
-    finish = text.find("),", start) + 1
-    next = finish
-    while next > 0:
-        date_to_convert = text[start:finish]
-        date_to_convert_array = date_to_convert[
-            date_to_convert.find("(") + 1 : date_to_convert.find(")")
-        ].split(",")
-        date_output = f'"{date_to_convert_array[0]}-{int(date_to_convert_array[1])+1:02d}-{date_to_convert_array[2]}T00:00:00"'
-        text = text.replace(date_to_convert, date_output)
-        start = text.find("new Date", next)
-        finish = text.find("),", start) + 1
-        next = finish
-
-    return text
+    if output in ["table", "wide"] and show_totals:
+        click.echo(
+            "For the "
+            + (
+                f"month of {calendar.month_name[date_datetime.month]}"
+                if query_range == "Monthly"
+                else "day of " + date
+                if query_range == "Daily"
+                else "week of " + date
+            )
+            + ", here are the totals:"
+        )
+    render(
+        rows,
+        headers,
+        "table" if output == "wide" else output,
+        page_size=page_size,
+        numalign="left",
+    )
 
 
 @click.command(name="set")
@@ -320,9 +334,14 @@ def convert_date(text):
     show_default="selected project_id",
 )
 @click.option("--bs", help="For when you need to dazzle!", is_flag=True)
+@click.option(
+    "--queue",
+    help="Records the entry in the local journal instead, sent later by 'abak timesheet flush'",
+    is_flag=True,
+)
 @click.pass_context
 def timesheet_set(
-    ctx, date, description, context, hours, client_id, project_id, bs, yesterday
+    ctx, date, description, context, hours, client_id, project_id, bs, yesterday, queue
 ):
     """
     Creates a timesheet entry in ABAK
@@ -369,6 +388,23 @@ def timesheet_set(
     else:
         validate_description(ctx, "description", description)
 
+    if queue:
+        option_not_none("client id", client_id)
+        option_not_none("project id", project_id)
+        operation_id = enqueue(
+            "set",
+            [
+                {
+                    "client_id": client_id,
+                    "project_id": project_id,
+                    "date": date,
+                    "description": description,
+                    "hours": hours,
+                }
+            ],
+        )[0]
+        click.echo(f"Timesheet entry queued as operation {operation_id}")
+        return
     set_timesheet_entry(client_id, project_id, date, description, hours)
 
 
@@ -385,9 +421,38 @@ def timesheet_set(
     type=click.Choice(["json", "yaml", "yml"]),
     help="Outputs an example file",
 )
-def timesheet_apply(ctx, file, example):
+@click.option(
+    "--concurrency",
+    help="Number of entries sent to ABAK at the same time",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "--rate-limit",
+    help="Maximum number of entries sent per second, 0 for no limit",
+    type=click.FloatRange(min=0),
+    default=0,
+    show_default=True,
+)
+@click.option(
+    "--dry-run",
+    help="Only shows what would be created, updated and deleted",
+    is_flag=True,
+)
+@click.option(
+    "--prune",
+    help="Deletes the entries of the same dates and projects that are not in the file",
+    is_flag=True,
+)
+@click.option(
+    "--queue",
+    help="Records the entries in the local journal instead, sent later by 'abak timesheet flush'",
+    is_flag=True,
+)
+def timesheet_apply(ctx, file, example, concurrency, rate_limit, dry_run, prune, queue):
     """
-    Applies all the entries from the given file
+    Applies all the entries from the given file, only changing the entries that differ from ABAK
     Currently supported formats:
         json, yaml and yml
     """
@@ -423,6 +488,8 @@ def timesheet_apply(ctx, file, example):
         if example == "json":
             click.echo(json.dumps(example_object))
         elif example in ["yaml", "yml"]:
+            import yaml
+
             click.echo(yaml.safe_dump(example_object))
         exit()
 
@@ -439,175 +506,570 @@ def timesheet_apply(ctx, file, example):
         if format == "json":
             data = json.loads(filereader.read())
         elif format in ["yaml", "yml"]:
+            import yaml
+
             data = yaml.load(filereader.read(), Loader=yaml.BaseLoader)
 
-    for client in data.get("clients"):
-        for project in client.get("projects"):
-            for entry in project.get("entries"):
-                validate_entry_date(None, None, entry.get("date"))
-                validate_description(None, None, entry.get("description"))
-                set_timesheet_entry(
-                    client.get("clientId"),
-                    project.get("projectId"),
-                    entry.get("date"),
-                    entry.get("description"),
-                    entry.get("hours"),
+    entries = [
+        {
+            "client_id": client.get("clientId"),
+            "project_id": project.get("projectId"),
+            "date": entry.get("date"),
+            "description": entry.get("description"),
+            "hours": entry.get("hours"),
+        }
+        for client in data.get("clients")
+        for project in client.get("projects")
+        for entry in project.get("entries")
+    ]
+    if queue:
+        queued = []
+        for entry in entries:
+            try:
+                validate_entry(entry, config)
+                queued.append({**entry, "prune": prune})
+            except (Sorry, ValueError, TypeError) as error:
+                click.echo(
+                    f"Skipping the entry of {entry['date']} '{entry['description']}': "
+                    + error_message(error)
                 )
+        enqueue("apply", queued)
+        click.echo(
+            f"{len(queued)} entries queued, send them with 'abak timesheet flush'"
+        )
+        if len(queued) < len(entries):
+            ctx.exit(1)
+        return
+
+    plan = plan_timesheet_entries(entries, prune)
+    unchanged = len([item for item in plan if item["action"] == "unchanged"])
+    if dry_run:
+        echo_apply_table(
+            [
+                (item, item["id"], item.get("error"))
+                for item in plan
+                if item["action"] != "unchanged"
+            ]
+        )
+        click.echo(
+            ", ".join(
+                f"{len([item for item in plan if item['action'] == action])} to {action}"
+                for action in ["create", "update", "delete"]
+            )
+            + f", {unchanged} unchanged"
+        )
+        return
+
+    results, summary = execute_plan(plan, concurrency, rate_limit)
+    if results:
+        echo_apply_table(
+            [(result["item"], result["result"], result["error"]) for result in results]
+        )
+    click.echo(f"{unchanged} entries were already up to date")
+    click.echo(format_summary(summary))
+    if summary["failed"]:
+        ctx.exit(1)
+
+
+def echo_apply_table(rows):
+    headers = ["Action", "Date", "Client", "Project", "Description", "Hrs", "ID", "Error"]
+    click.echo(
+        tabulate(
+            [
+                [
+                    item["action"],
+                    item["date"],
+                    item["client_id"],
+                    item["project_id"],
+                    item["description"],
+                    item["hours"],
+                    timesheet_id or "",
+                    error or "",
+                ]
+                for item, timesheet_id, error in rows
+            ],
+            headers=headers,
+        )
+    )
 
 
 def set_timesheet_entry(client_id, project_id, date, description, hours):
-    option_not_none("client id", client_id)
-    option_not_none("project id", project_id)
+    new_id = create_timesheet_entry(client_id, project_id, date, description, hours)
+    click.echo("Timesheet entry " + new_id + " created successully!")
+
+
+def get_weekly_timesheet(ctx, *args, **kwargs):
     config = get_config()
-    date = datetime.strftime(
-        datetime.strptime(date, config["date_format"]),
-        get_date_format_from_abak(config["abak_date_format"]),
+    date = datetime.strftime(datetime.now(), format=config["date_format"])
+    return [
+        (row["Id"], row["Description"]) for row in get_transactions(date, "Weekly")
+    ]
+
+
+@click.command(name="report")
+@click.pass_context
+@click.option(
+    "--from",
+    "from_date",
+    help='First day of the report. Format in the config key "date_format"',
+    required=True,
+    callback=validate_report_date,
+)
+@click.option(
+    "--to",
+    "to_date",
+    help='Last day of the report. Format in the config key "date_format"',
+    required=True,
+    callback=validate_report_date,
+)
+@click.option(
+    "--group-by",
+    "-g",
+    help="Groups the totals by these keys, in the given order",
+    type=click.Choice(list(TOTALS_GROUPS)),
+    multiple=True,
+    default=["context"],
+    show_default=True,
+)
+@click.option(
+    "-o",
+    "--output",
+    help="The output type you want",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="table",
+)
+@click.option(
+    "--concurrency",
+    help="Number of ranges fetched from ABAK at the same time",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "--tier",
+    "tiers",
+    help='Adds the amount at the price of this tier, set in the "Tiers" of the contexts',
+    multiple=True,
+)
+@click.option(
+    "--engine",
+    help="How the totals are computed, auto uses pandas for large periods",
+    type=click.Choice(TOTALS_ENGINES),
+    default="auto",
+    show_default=True,
+)
+@click.argument("context-filter", required=False)
+def timesheet_report(
+    ctx,
+    from_date,
+    to_date,
+    group_by,
+    output,
+    concurrency,
+    tiers,
+    engine,
+    context_filter,
+):
+    """
+    Totals the hours and the amounts billed over any period, with one request per month
+    """
+    contexts = get_contexts()
+    if context_filter and context_filter not in contexts:
+        raise click.exceptions.BadOptionUsage(
+            "context_filter", f"Context '{context_filter}' doesn't exist!"
+        )
+    transactions = get_transactions_for_days(
+        days_between(from_date, to_date), concurrency
+    )
+    resolve_context = get_context_resolver(transactions, contexts)
+    if context_filter:
+        transactions = [
+            transaction
+            for transaction in transactions
+            if context_filter == resolve_context(transaction)
+        ]
+    rows = compute_totals(
+        transactions, resolve_context, contexts, list(group_by), tiers, engine
+    )
+
+    if output == "table":
+        click.echo(f"From {from_date} to {to_date}, here are the totals:")
+    render(rows, list(rows[0].keys()), output, numalign="left")
+
+
+@click.command(name="export")
+@click.pass_context
+@click.option(
+    "--from",
+    "from_date",
+    help='First day to export. Format in the config key "date_format"',
+    required=True,
+    callback=validate_report_date,
+)
+@click.option(
+    "--to",
+    "to_date",
+    help='Last day to export. Format in the config key "date_format"',
+    required=True,
+    callback=validate_report_date,
+)
+@click.option(
+    "-f",
+    "--format",
+    "export_format",
+    help="The format of the file, parquet and arrow need pyarrow",
+    type=click.Choice(EXPORT_FORMATS),
+    default="csv",
+    show_default=True,
+)
+@click.option(
+    "--file",
+    help="File to write, '-' writes to the standard output",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    default="-",
+    show_default=True,
+)
+@click.option(
+    "--concurrency",
+    help="Number of ranges fetched from ABAK at the same time",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+)
+@click.argument("context-filter", required=False)
+def timesheet_export(
+    ctx, from_date, to_date, export_format, file, concurrency, context_filter
+):
+    """
+    Exports the timesheet entries of a period with one typed column per field, and the
+    context and price of the hour of each entry, for billing tools
+    """
+    contexts = get_contexts()
+    if context_filter and context_filter not in contexts:
+        raise click.exceptions.BadOptionUsage(
+            "context_filter", f"Context '{context_filter}' doesn't exist!"
+        )
+    transactions = get_transactions_for_days(
+        days_between(from_date, to_date), concurrency
     )
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    body = {
-        "MIME Type": "application/x-www-form-urlencoded; charset=UTF-8",
-        "fieldDate": date,
-        "typeTab": "timesheetDetail",
-        "": "true",
-        "rangeField": "Weekly",
-        "defaultDate": date,
-        "fieldId": "",
-        "fieldIsDuplicatingTs": False,
-        "fieldEmployeeId": config["user_id"],
-        "isPhaseEmplAssigned": "",
-        "isDefaultTaskAssignedOnEmp": "",
-        "isDefaultPayCodeAssignedOnEmp": "",
-        "defaultPayCodeAssignedOnEmp": "",
-        "taskDefaultPayCode": "",
-        "isDefaultTaskAssignedOnFun": "",
-        "isDefaultPayCodeAssignedOnFun": "",
-        "defaultPayCodeAssignedOnFun": "",
-        "isPhaseFunctionAssigned": "",
-        "taskDefaultTaskCode": "",
-        "phaseDefaultPayCode": "",
-        "functionDefaultTaskCode": "",
-        "phaseDefaultDepartment": "",
-        "phaseDefaultReference": "",
-        "isPhaseBillable": "",
-        "phaseDefaultExpenseType": "",
-        "defaultDepartmentAssignedOnEmp": "",
-        "defaultReferenceAssignedOnEmp": "",
-        "defaultExpenseTypeAssignedOnEmp": "",
-        "defaultDepartmentAssignedOnFun": "",
-        "defaultReferenceAssignedOnFun": "",
-        "defaultExpenseTypeAssignedOnFun": "",
-        "defaultTaskAssignedOnEmp": "",
-        "defaultTaskAssignedOnFun": "",
-        "defaultPayCodeOnTaskAssignedOnEmp": "",
-        "defaultPayCodeOnTaskAssignedOnFun": "",
-        "phaseDescFr": "",
-        "phaseDescEn": "",
-        "phaseDesc": "",
-        "queryTextField": "Consulting by Associate (CONS)",
-        "fieldManualCost": "",
-        "fieldManualDayCost": "",
-        "fieldManualSelling": "",
-        "fieldManualDaySelling": "",
-        "fieldcheckPaySystem": "fieldcheckPaySystem",
-        "fieldcheckPaySystemSate": "fieldcheckPaySystemSate",
-        "payCodeIsInList": "true",
-        "clientIsInList": "true",
-        "projectIsInList": "true",
-        "taskCodeIsInList": "true",
-        "departmentIsInList": "true",
-        "datebookId": "",
-        "fieldClientId_Value": client_id,
-        "fieldClientId_SelIndex": -1,
-        "fieldProjectId_Value": project_id,
-        "fieldProjectId_SelIndex": -1,
-        "fieldTaskCode_Value": "CONS",
-        "fieldTaskCode_SelIndex": -1,
-        "fieldPhaseId": "",
-        "fieldPhaseId_current": "",
-        "fieldPhaseIdReal": "",
-        "fieldMSProjectCode": "",
-        "fieldMsProject": "",
-        "fieldDescription_Value": description,
-        "fieldDescription": description,
-        "fieldDescription_SelIndex": "-1",
-        "fieldReference": "",
-        "fieldIsPrintOnInvoice": "fieldIsPrintOnInvoice",
-        "fieldDepartmentId_Value": "",
-        "fieldDepartmentId": "",
-        "fieldDepartmentId_SelIndex": -1,
-        "fieldPayCode_Value": "REG",
-        "fieldPayCode": "Regular (REG)",
-        "fieldPayCode_SelIndex": -1,
-        "fieldIsAffectingTimebank": "fieldIsAffectingTimebank",
-        "fieldQuantity": str(hours) + " hrs",
-        "fieldTimeStart_Value": "",
-        "fieldTimeStart": "",
-        "fieldTimeStart_SelIndex": -1,
-        "fieldTimeEnd_Value": "",
-        "fieldTimeEnd": "",
-        "fieldTimeEnd_SelIndex": -1,
-        "fieldLunchTime": "0.00 hrs",
-        "fieldIsBillable": "fieldIsBillable",
-        "fieldBillableQuantity": str(hours) + " hrs",
-        "panelGroupInvoicableTimesheetDetailFieldUnitCost": "0.0000 $",
-        "TimesheetDetailFieldSubTotal": "0.00 $",
-        "fieldEmployeeTimesheetDetail": "",
-        "fieldNote": "",
-        "billableDescriptionTimesheetDetail": "",
-        "fieldBillableNoteTimesheetDetail": "",
-        "tabPanel_ActiveTab": {"tabDetail": 0},
-    }
-    timesheet_entry = httprequest("POST", body, "/Abak/Timesheet/Edit", headers=headers)
-    if not timesheet_entry.get("success"):
+    resolve_context = get_context_resolver(transactions, contexts)
+    if context_filter:
+        transactions = [
+            transaction
+            for transaction in transactions
+            if context_filter == resolve_context(transaction)
+        ]
+    export_transactions(
+        build_columns(transactions, resolve_context, contexts), export_format, file
+    )
+
+
+@click.command(name="sync")
+@click.pass_context
+@click.option(
+    "--months",
+    help="Number of months before the current one to keep in the local store",
+    type=click.IntRange(min=0),
+    default=store.DEFAULT_SYNC_MONTHS,
+    show_default=True,
+)
+@click.option(
+    "--full", help="Fetches every month again, even the closed ones", is_flag=True
+)
+@click.option(
+    "--concurrency",
+    help="Number of months fetched from ABAK at the same time",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+)
+def timesheet_sync(ctx, months, full, concurrency):
+    """
+    Copies the timesheet entries to the local store, which list, report and apply read
+    the closed months from. A month is closed when every entry is approved. Only the
+    months still open, changed since the last sync or synced more than a day ago
+    ("store_ttl" config key, in seconds) are fetched again.
+    """
+    config = get_config()
+    if not store.is_store_enabled(config):
         raise Sorry(
-            timesheet_entry.get(
-                "extraParams", {"Message": "there was an error with your request"}
-            ).get("Message")
+            "the local store is turned off, turn it on with "
+            "'abak config set -k transaction_store -v on'"
         )
+    to_sync = store.months_to_sync(months, full, config)
+    results, summary = run_bulk(to_sync, sync_month, concurrency=concurrency)
+    stored = store.get_months(config)
     click.echo(
-        "Timesheet entry "
-        + timesheet_entry.get("extraParams", {"newID": ""}).get("newID")
-        + " created successully!"
+        tabulate(
+            [
+                [
+                    result["item"],
+                    "" if result["error"] else result["result"],
+                    "closed"
+                    if stored.get(result["item"], {}).get("closed")
+                    else "open",
+                    result["error"] or "",
+                ]
+                for result in results
+            ],
+            headers=["Month", "Entries", "Status", "Error"],
+        )
     )
+    click.echo(f"{months + 1 - len(to_sync)} closed months were already up to date")
+    click.echo(format_summary(summary))
+    if summary["failed"]:
+        ctx.exit(1)
 
 
-def get_weekly_timesheet(ctx, *args, **kwargs):
+@click.command(name="delete")
+@click.pass_context
+@click.argument("timesheet_ids", nargs=-1)
+@click.option(
+    "--from",
+    "from_date",
+    help='Selects the entries from this day. Format in the config key "date_format"',
+    callback=validate_report_date,
+)
+@click.option(
+    "--to",
+    "to_date",
+    help="Selects the entries up to this day, the day of --from by default",
+    callback=validate_report_date,
+)
+@click.option(
+    "--context", "-c", "context_filter", help="Selects the entries of a context"
+)
+@click.option(
+    "--project",
+    "-p",
+    help="Selects the entries of a project, by ID or part of its name",
+)
+@click.option(
+    "--description",
+    "-d",
+    help="Selects the entries whose description matches this regular expression",
+)
+@click.option("--dry-run", help="Only shows the entries to delete", is_flag=True)
+@click.option("--yes", "-y", is_flag=True, help="Deletes without asking")
+@click.option(
+    "--concurrency",
+    help="Number of batches of entries deleted at the same time",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "--queue",
+    help="Records the deletion in the local journal instead, sent later by 'abak timesheet flush'",
+    is_flag=True,
+)
+def timesheet_delete(
+    ctx,
+    timesheet_ids,
+    from_date,
+    to_date,
+    context_filter,
+    project,
+    description,
+    dry_run,
+    yes,
+    concurrency,
+    queue,
+):
+    """
+    Deletes timesheet entries from ABAK, given by ID or selected over a range of days
+    """
+    selection = [to_date, context_filter, project, description]
+    if timesheet_ids and (from_date or any(selection)):
+        raise Sorry("give either the IDs of the entries or a selection, not both")
+    if not timesheet_ids and not from_date:
+        raise Sorry("give the IDs of the entries, or select them starting --from a day")
+
+    if from_date:
+        timesheet_ids = select_timesheet_entries(
+            from_date,
+            to_date or from_date,
+            context_filter,
+            project,
+            description,
+            concurrency,
+        )
+        if not timesheet_ids:
+            click.echo("No timesheet entries match the selection")
+            return
+        if dry_run:
+            return
+        if not yes:
+            click.confirm(
+                f"Are you sure that you want to delete these {len(timesheet_ids)} "
+                "timesheet entries?",
+                abort=True,
+            )
+    elif dry_run:
+        click.echo("Would delete " + ", ".join(timesheet_ids))
+        return
+
+    timesheet_ids = list(dict.fromkeys(timesheet_ids))
+    if queue:
+        operation_ids = enqueue("delete", [{"id": item} for item in timesheet_ids])
+        for timesheet_id, operation_id in zip(timesheet_ids, operation_ids):
+            click.echo(f"Deletion of {timesheet_id} queued as operation {operation_id}")
+        return
+    results, summary = delete_in_batches(timesheet_ids, concurrency)
+    if len(timesheet_ids) == 1 and not summary["failed"]:
+        click.echo("Timesheet entry " + timesheet_ids[0] + " deleted successfully!")
+        return
+    failures = [
+        [result["item"], result["error"]] for result in results if result["error"]
+    ]
+    if failures:
+        click.echo(tabulate(failures, headers=["ID", "Error"]))
+    click.echo(format_summary(summary))
+    if failures:
+        ctx.exit(1)
+
+
+def select_timesheet_entries(
+    from_date, to_date, context_filter, project, description, concurrency
+):
+    """
+    Shows the entries of the days that match the filters
+
+    Returns:
+        list: their IDs
+    """
     config = get_config()
-    date = datetime.strftime(datetime.now(), format=config["date_format"])
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-    }
-    body = {
-        "groupBy": "TransactType",
-        "groupDir": "ASC",
-        "summaryFields": "Quantity",
-        "summaryTypes": "sum",
-        "sort": "Date",
-        "dir": "ASC",
-        "employe": config["user_id"],
-        "date": date + "T00:00:00",
-        "range": range,
-    }
-    output_value = httprequest(
-        "POST", body, "/Abak/Transact/GetGroupedTransacts", headers=headers
+    contexts = get_contexts()
+    if context_filter and context_filter not in contexts:
+        raise click.exceptions.BadOptionUsage(
+            "context_filter", f"Context '{context_filter}' doesn't exist!"
+        )
+    transactions = get_transactions_for_days(
+        days_between(from_date, to_date), concurrency
     )
-    return [(row["Id"], row["Description"]) for row in output_value.get("data")]
+    resolve_context = get_context_resolver(transactions, contexts)
+    selected = sorted(
+        filter_transactions(
+            transactions, resolve_context, context_filter, project, description
+        ),
+        key=lambda transaction: (transaction["Date"], str(transaction["Id"])),
+    )
+    if selected:
+        click.echo("Here are the timesheet entries to be deleted:")
+        headers = ["Weekday", "Date", "Context", "Description", "Hrs", "ID"]
+        output_format = {
+            "Weekday": "Date",
+            "Date": "Date",
+            "Context": "ProjectName",
+            "Description": "Description",
+            "Hrs": "Quantity",
+            "ID": "Id",
+        }
+        render(
+            (
+                format_transaction(row, headers, output_format, resolve_context, config)
+                for row in selected
+            ),
+            headers,
+            "table",
+            numalign="left",
+        )
+    return [str(transaction["Id"]) for transaction in selected]
 
 
-@click.command(name="delete")
+@click.command(name="flush")
 @click.pass_context
-@click.argument("timesheet_id")
-def timesheet_delete(ctx, timesheet_id):
+@click.option(
+    "--concurrency",
+    help="Number of operations sent to ABAK at the same time",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "--retries",
+    help="Number of times the failed operations are sent again",
+    type=click.IntRange(min=0),
+    default=DEFAULT_FLUSH_RETRIES,
+    show_default=True,
+)
+@click.option(
+    "--backoff",
+    help="Seconds before the first retry, doubled at each retry",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_FLUSH_BACKOFF,
+    show_default=True,
+)
+@click.option(
+    "--list",
+    "list_only",
+    help="Only shows the operations waiting in the journal",
+    is_flag=True,
+)
+@click.option(
+    "--discard",
+    help="ID of an operation to remove from the journal without sending it",
+    type=int,
+    multiple=True,
+)
+def timesheet_flush(ctx, concurrency, retries, backoff, list_only, discard):
     """
-    Deletes a timesheet entry from ABAK
+    Sends the operations queued with --queue to ABAK, retrying the ones that fail
     """
-    headers = {"Content-Type": "application/json; charset=utf-8"}
-    body = {"transacts": [{"key": timesheet_id, "value": "T"}]}
+    if discard:
+        discard_operations(discard)
+        click.echo(f"{len(discard)} operations discarded")
+        return
+    if list_only:
+        echo_journal_table(
+            [
+                (operation, "queued", operation["error"])
+                for operation in get_queued_operations()
+            ]
+        )
+        return
 
-    result = httprequest(
-        "POST", body, "/Abak/Transact/DeleteTransacts", is_json=True, headers=headers
+    results, summary = flush_queue(concurrency, retries, backoff)
+    if not results:
+        click.echo("There are no queued operations")
+        return
+    echo_journal_table(
+        [
+            (
+                result["item"],
+                "failed" if result["error"] else "sent",
+                result["error"] or result["result"],
+            )
+            for result in results
+        ]
+    )
+    click.echo(format_summary(summary))
+    if summary["failed"]:
+        ctx.exit(1)
+
+
+def echo_journal_table(rows):
+    headers = ["ID", "Action", "Entry", "Attempts", "Status", "Result"]
+    click.echo(
+        tabulate(
+            [
+                [
+                    operation["id"],
+                    operation["action"],
+                    operation["payload"]["id"]
+                    if operation["action"] == "delete"
+                    else f"{operation['payload']['date']} "
+                    f"{operation['payload']['hours']}h "
+                    f"{operation['payload']['description']}",
+                    operation["attempts"],
+                    status,
+                    result or "",
+                ]
+                for operation, status, result in rows
+            ],
+            headers=headers,
+        )
     )
-    click.echo("Timesheet entry " + timesheet_id + " deleted successfully!")
 
 
 @click.command(name="approve")
@@ -627,94 +1089,144 @@ def timesheet_delete(ctx, timesheet_id):
     required=True,
 )
 @click.option("--remove", is_flag=True, help="Unapproves the timesheet range")
-def timesheet_approve(ctx, start_date, end_date, remove):
+@click.option(
+    "--employee",
+    "-E",
+    "employee_ids",
+    help="ID of an employee to approve, can be repeated. Yourself by default",
+    multiple=True,
+)
+@click.option(
+    "--employees-file",
+    help="File with one employee ID per line, '-' reads them from the standard input",
+    type=click.File("r"),
+)
+@click.option("--yes", "-y", is_flag=True, help="Approves without asking")
+@click.option(
+    "--concurrency",
+    help="Number of employees fetched and approved at the same time",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+)
+def timesheet_approve(
+    ctx,
+    start_date,
+    end_date,
+    remove,
+    employee_ids,
+    employees_file,
+    yes,
+    concurrency,
+):
     """
-    Approve timesheet entries
+    Approve timesheet entries, of yourself or of several employees at once
     """
     config = get_config()
-    body = {
-        "MIME Type": "application/x-www-form-urlencoded; charset=UTF-8",
-        "employeeId": config["user_id"],
-        "groupBy": "Date",
-        "groupDir": "ASC",
-        "summaryFields": "Quantity",
-        "summaryFields": "BillableQuantity",
-        "summaryFields": "TotalExpense",
-        "summaryTypes": "sum",
-        "summaryTypes": "sum",
-        "summaryTypes": "sum",
-        "sort": "Date",
-        "dir": "DESC",
-        "startDate": start_date + "T00:00:00",
-        "endDate": end_date + "T00:00:00",
-        "approvalType": "Timesheet",
-        "start": "0",
-        "limit": "50",
-    }
-
-    output_value = httprequest(
-        "POST", body, "/Abak/Approval/GetApprovalsList", is_json=True
+    # Weekdays are turned into their day once, the confirmation shows the real range
+    start_date = resolve_entry_date(start_date, config).strftime(config["date_format"])
+    end_date = resolve_entry_date(end_date, config).strftime(config["date_format"])
+    employee_ids = read_employee_ids(employee_ids, employees_file) or [
+        config["user_id"]
+    ]
+    fetched = get_approvals_for_employees(
+        employee_ids, start_date, end_date, concurrency
     )
-
-    output_format = {
-        "Date": "Date",
-        "Project": "ProjectName",
-        "Description": "Description",
-        "Hrs": "Quantity",
-    }
-    headers = [header for header in output_format]
-    rows = []
-    for row in output_value["data"]:
-        instance = []
-        for header in headers:
-            instance.append(
-                row[output_format.get(header)]
-                if header != "Date"
-                else row[output_format.get(header)].split("T00")[0]
-            )
-        rows.append(instance)
     if not remove:
         click.echo("Here are the timesheet entries to be approved:")
     else:
         click.echo("Here are the timesheet entries to be Unapproved:")
 
-    print(tabulate(rows, headers=headers))
-    if not remove:
-        click.confirm(
-            "Are you sure that you want to approve these timesheets from "
-            + start_date
-            + " to "
-            + end_date
-            + "?",
-            abort=True,
+    if len(employee_ids) == 1:
+        if fetched[0]["error"]:
+            raise Sorry(fetched[0]["error"])
+        print(
+            tabulate(
+                [
+                    [
+                        row["Date"][:10],
+                        row["ProjectName"],
+                        row["Description"],
+                        row["Quantity"],
+                    ]
+                    for row in fetched[0]["result"]
+                ],
+                headers=["Date", "Project", "Description", "Hrs"],
+            )
         )
+        employees = "these timesheets"
     else:
-        click.confirm(
-            "Are you sure that you want to remove the approval for these timesheets from "
-            + start_date
-            + " to "
-            + end_date
-            + "?",
-            abort=True,
+        click.echo(
+            tabulate(
+                summarize_approvals(fetched),
+                headers=[
+                    "Employee",
+                    "Entries",
+                    "Hrs",
+                    "First Day",
+                    "Last Day",
+                    "Error",
+                ],
+            )
         )
+        employees = f"the timesheets of {len(employee_ids)} employees"
+    # The employees whose entries couldn't be fetched are left out
+    to_approve = [result["item"] for result in fetched if not result["error"]]
+    if not to_approve:
+        raise Sorry("none of the timesheets could be fetched")
 
-    if not remove:
-        path = "/Abak/Approval/ApproveRangeFromApprobation"
-    else:
-        path = "/Abak/Approval/UnapproveRange"
-    body = {
-        "MIME Type": "application/x-www-form-urlencoded; charset=UTF-8",
-        "approvalType": "Timesheet",
-        "employeeId": config["user_id"],
-        "startDate": start_date,
-        "endDate": end_date,
-    }
-
-    result = httprequest("POST", body, path, is_json=True)
-    if not remove:
-        click.echo("Timesheets approved successfully!")
-    else:
-        click.echo("Timesheets unapproved successfully!")
+    if not yes:
+        if not remove:
+            click.confirm(
+                f"Are you sure that you want to approve {employees} from "
+                + start_date
+                + " to "
+                + end_date
+                + "?",
+                abort=True,
+            )
+        else:
+            click.confirm(
+                f"Are you sure that you want to remove the approval for {employees} from "
+                + start_date
+                + " to "
+                + end_date
+                + "?",
+                abort=True,
+            )
+
+    results, summary = set_approvals(
+        to_approve, start_date, end_date, remove, concurrency
+    )
+    if len(employee_ids) == 1:
+        if results[0]["error"]:
+            raise Sorry(results[0]["error"])
+        if not remove:
+            click.echo("Timesheets approved successfully!")
+        else:
+            click.echo("Timesheets unapproved successfully!")
+        return
+
+    click.echo(
+        tabulate(
+            [
+                [
+                    result["item"],
+                    "failed"
+                    if result["error"]
+                    else "unapproved"
+                    if remove
+                    else "approved",
+                    result["error"] or "",
+                ]
+                for result in results
+            ],
+            headers=["Employee", "Result", "Error"],
+        )
+    )
+    click.echo(format_summary(summary))
+    if summary["failed"] or len(to_approve) < len(employee_ids):
+        ctx.exit(1)
 
 
 timesheet.add_command(timesheet_list)
@@ -722,3 +1234,7 @@ timesheet.add_command(timesheet_set)
 timesheet.add_command(timesheet_delete)
 timesheet.add_command(timesheet_approve)
 timesheet.add_command(timesheet_apply)
+timesheet.add_command(timesheet_report)
+timesheet.add_command(timesheet_export)
+timesheet.add_command(timesheet_sync)
+timesheet.add_command(timesheet_flush)
@@ -0,0 +1,207 @@
+import calendar
+import functools
+import importlib.util
+from datetime import datetime, timedelta
+
+TOTALS_GROUPS = {
+    "context": "Context",
+    "client": "Client",
+    "project": "Project",
+    "weekday": "Weekday",
+    "week": "Week",
+    "month": "Month",
+}
+TOTALS_ENGINES = ["auto", "pandas", "python"]
+# Importing pandas takes about half a second, measured with the import, pandas gets
+# ahead of the single pass from around 300000 transactions
+PANDAS_MIN_ROWS = 300000
+UNASSIGNED_CONTEXT = "Context Unassigned"
+# Keys of the transactions telling how many of their hours are billed
+BILLABLE_KEY = "IsBillable"
+BILLABLE_QUANTITY_KEY = "BillableQuantity"
+
+
+def get_price(contexts, context, tier=None):
+    """
+    Returns the price of the hour of a context, for a tier of its "Tiers" when given. A
+    tier the context doesn't define uses the price of the context.
+    """
+    settings = contexts.get(context, {})
+    price = settings.get("Tiers", {}).get(tier) if tier else None
+    return float(settings.get("Price") or 0) if price is None else float(price)
+
+
+def billable_quantity(transaction):
+    """
+    Returns the billed hours of a transaction, all of them unless Abak says otherwise
+    """
+    quantity = transaction.get("Quantity") or 0
+    if transaction.get(BILLABLE_QUANTITY_KEY) is not None:
+        return transaction[BILLABLE_QUANTITY_KEY]
+    if transaction.get(BILLABLE_KEY) is False:
+        return 0
+    return quantity
+
+
+def group_value(transaction, context, group):
+    if group == "context":
+        return context or UNASSIGNED_CONTEXT
+    if group == "client":
+        return transaction.get("ClientName") or str(transaction.get("ClientId") or "")
+    if group == "project":
+        return transaction.get("ProjectName") or str(transaction.get("ProjectId") or "")
+    return day_group_value(transaction["Date"][:10], group)
+
+
+@functools.lru_cache(maxsize=4096)
+def day_group_value(day_text, group):
+    # Periods have a few hundred days at most, their groups are only computed once
+    day = datetime.strptime(day_text, "%Y-%m-%d").date()
+    if group == "weekday":
+        return calendar.day_name[day.weekday()]
+    if group == "month":
+        return day_text[:7]
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def sort_key(key, group_by):
+    # Weekdays are sorted from Monday, every other group by its value
+    return tuple(
+        list(calendar.day_name).index(value) if group == "weekday" else value
+        for value, group in zip(key, group_by)
+    )
+
+
+def total_headers(tiers):
+    return ["Hrs", "Billable", "Non-billable", "Amount"] + [
+        f"Amount {tier}" for tier in tiers
+    ]
+
+
+def python_totals(transactions, resolve_context, contexts, group_by, tiers):
+    """
+    Adds up the transactions in a single pass
+
+    Returns:
+        dict: {key: [hours, billable hours, amount, amount of each tier]}
+    """
+    totals = {}
+    prices = {}
+    for transaction in transactions:
+        context = resolve_context(transaction)
+        if context not in prices:
+            prices[context] = [
+                get_price(contexts, context, tier) for tier in [None] + tiers
+            ]
+        key = tuple(group_value(transaction, context, group) for group in group_by)
+        hours = transaction.get("Quantity") or 0
+        billable = billable_quantity(transaction)
+        total = totals.setdefault(key, [0] * (len(tiers) + 3))
+        total[0] += hours
+        total[1] += billable
+        for index, price in enumerate(prices[context]):
+            total[index + 2] += billable * price
+    return totals
+
+
+def pandas_totals(transactions, resolve_context, contexts, group_by, tiers):
+    """
+    Same as python_totals, with the groups, prices and amounts computed on whole columns
+    """
+    import pandas
+
+    frame = pandas.DataFrame(
+        {
+            "context": [
+                resolve_context(transaction) or UNASSIGNED_CONTEXT
+                for transaction in transactions
+            ],
+            "day": [transaction["Date"][:10] for transaction in transactions],
+            "hours": [transaction.get("Quantity") or 0 for transaction in transactions],
+            "billable": [
+                billable_quantity(transaction) for transaction in transactions
+            ],
+        }
+    )
+    for group in group_by:
+        if group in ["client", "project"]:
+            frame[group] = [
+                group_value(transaction, None, group) for transaction in transactions
+            ]
+        elif group != "context":
+            frame[group] = frame["day"].map(
+                {day: day_group_value(day, group) for day in frame["day"].unique()}
+            )
+    values = ["hours", "billable"]
+    for index, tier in enumerate([None] + tiers):
+        prices = {
+            context: get_price(
+                contexts, None if context == UNASSIGNED_CONTEXT else context, tier
+            )
+            for context in frame["context"].unique()
+        }
+        frame[f"amount{index}"] = frame["billable"] * frame["context"].map(prices)
+        values.append(f"amount{index}")
+    grouped = frame.groupby(group_by, sort=False)[values].sum()
+    return {
+        (key if isinstance(key, tuple) else (key,)): [float(value) for value in row]
+        for key, row in zip(grouped.index, grouped.itertuples(index=False))
+    }
+
+
+def is_pandas_available():
+    return importlib.util.find_spec("pandas") is not None
+
+
+def compute_totals(
+    transactions, resolve_context, contexts, group_by, tiers=[], engine="auto"
+):
+    """
+    Adds up the hours of the transactions, the billed ones and what they bill at the
+    price of the hour of their context
+
+    Args:
+        transactions (list): transactions returned by GetGroupedTransacts
+        resolve_context (function): returns the context name of a transaction
+        contexts (dict): the contexts of the configuration
+        group_by (list): keys of TOTALS_GROUPS, weeks start on Monday
+        tiers (list): names of the "Tiers" of the contexts, each adds an amount column
+        engine (str): one of TOTALS_ENGINES, "auto" uses pandas when it is installed and
+            there are enough transactions to make up for importing it
+
+    Returns:
+        list: one dict per group with its keys and total_headers(tiers), then a TOTAL row
+    """
+    tiers = list(tiers)
+    if engine == "auto":
+        engine = (
+            "pandas"
+            if len(transactions) >= PANDAS_MIN_ROWS and is_pandas_available()
+            else "python"
+        )
+    if engine == "pandas" and transactions:
+        totals = pandas_totals(transactions, resolve_context, contexts, group_by, tiers)
+    else:
+        totals = python_totals(transactions, resolve_context, contexts, group_by, tiers)
+
+    headers = [TOTALS_GROUPS[group] for group in group_by]
+    values = total_headers(tiers)
+
+    def as_row(key, total):
+        return {
+            **dict(zip(headers, key)),
+            **dict(zip(values, [total[0], total[1], total[0] - total[1], *total[2:]])),
+        }
+
+    rows = [
+        as_row(key, totals[key])
+        for key in sorted(totals, key=lambda key: sort_key(key, group_by))
+    ]
+    grand_total = [sum(column) for column in zip(*totals.values())]
+    rows.append(
+        as_row(
+            ["TOTAL"] + [""] * (len(headers) - 1),
+            grand_total or [0] * (len(tiers) + 3),
+        )
+    )
+    return rows
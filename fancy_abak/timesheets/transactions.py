@@ -0,0 +1,430 @@
+import copy
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from fancy_abak.abak_shared_functions import (
+    Sorry,
+    get_config,
+    httprequest,
+    option_not_none,
+    get_date_format_from_abak,
+)
+from fancy_abak.project import get_projects
+
+from . import store
+
+# Transactions kept in memory by the processes that run several commands, like the
+# daemon, for at most _memory_cache_ttl seconds
+_memory_cache = {}
+_memory_cache_lock = threading.Lock()
+_memory_cache_ttl = 0
+WEEKDAYS = [
+    "MONDAY",
+    "TUESDAY",
+    "WEDNESDAY",
+    "THURSDAY",
+    "FRIDAY",
+    "SATURDAY",
+    "SUNDAY",
+]
+
+
+def validate_entry_date(ctx, param, value):
+    if not value:
+        return None
+    config = get_config()
+    if value.upper() in WEEKDAYS:
+        return value
+    try:
+        datetime.strptime(value, config["date_format"])
+        return value
+    except:
+        raise Sorry(f"date needs to be in the format {config['date_format']}")
+
+
+def resolve_entry_date(value, config=None):
+    """
+    Turns a date accepted by validate_entry_date into a day, a weekday being the one of
+    the current week
+
+    Returns:
+        datetime.date: the day
+    """
+    config = config or get_config()
+    if value.upper() in WEEKDAYS:
+        today = date.today()
+        return today + timedelta(days=WEEKDAYS.index(value.upper()) - today.weekday())
+    try:
+        return datetime.strptime(value, config["date_format"]).date()
+    except ValueError:
+        raise Sorry(f"date needs to be in the format {config['date_format']}")
+
+
+def validate_description(ctx, param, value):
+    if not value:
+        raise Sorry("description ('--description', '-d') is a required parameter")
+    elif len(value) <= 100:
+        return value
+    else:
+        raise Sorry(
+            "description of the timesheet entry must not be larger than 100 characters"
+        )
+
+
+def create_timesheet_entry(
+    client_id, project_id, date, description, hours, timesheet_id=""
+):
+    """
+    Creates a timesheet entry, or updates it when timesheet_id is given
+
+    Returns:
+        str: the ID of the timesheet entry
+    """
+    option_not_none("client id", client_id)
+    option_not_none("project id", project_id)
+    config = get_config()
+    day = datetime.strptime(date, config["date_format"])
+    date = datetime.strftime(day, get_date_format_from_abak(config["abak_date_format"]))
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    body = {
+        "MIME Type": "application/x-www-form-urlencoded; charset=UTF-8",
+        "fieldDate": date,
+        "typeTab": "timesheetDetail",
+        "": "true",
+        "rangeField": "Weekly",
+        "defaultDate": date,
+        "fieldId": timesheet_id,
+        "fieldIsDuplicatingTs": False,
+        "fieldEmployeeId": config["user_id"],
+        "isPhaseEmplAssigned": "",
+        "isDefaultTaskAssignedOnEmp": "",
+        "isDefaultPayCodeAssignedOnEmp": "",
+        "defaultPayCodeAssignedOnEmp": "",
+        "taskDefaultPayCode": "",
+        "isDefaultTaskAssignedOnFun": "",
+        "isDefaultPayCodeAssignedOnFun": "",
+        "defaultPayCodeAssignedOnFun": "",
+        "isPhaseFunctionAssigned": "",
+        "taskDefaultTaskCode": "",
+        "phaseDefaultPayCode": "",
+        "functionDefaultTaskCode": "",
+        "phaseDefaultDepartment": "",
+        "phaseDefaultReference": "",
+        "isPhaseBillable": "",
+        "phaseDefaultExpenseType": "",
+        "defaultDepartmentAssignedOnEmp": "",
+        "defaultReferenceAssignedOnEmp": "",
+        "defaultExpenseTypeAssignedOnEmp": "",
+        "defaultDepartmentAssignedOnFun": "",
+        "defaultReferenceAssignedOnFun": "",
+        "defaultExpenseTypeAssignedOnFun": "",
+        "defaultTaskAssignedOnEmp": "",
+        "defaultTaskAssignedOnFun": "",
+        "defaultPayCodeOnTaskAssignedOnEmp": "",
+        "defaultPayCodeOnTaskAssignedOnFun": "",
+        "phaseDescFr": "",
+        "phaseDescEn": "",
+        "phaseDesc": "",
+        "queryTextField": "Consulting by Associate (CONS)",
+        "fieldManualCost": "",
+        "fieldManualDayCost": "",
+        "fieldManualSelling": "",
+        "fieldManualDaySelling": "",
+        "fieldcheckPaySystem": "fieldcheckPaySystem",
+        "fieldcheckPaySystemSate": "fieldcheckPaySystemSate",
+        "payCodeIsInList": "true",
+        "clientIsInList": "true",
+        "projectIsInList": "true",
+        "taskCodeIsInList": "true",
+        "departmentIsInList": "true",
+        "datebookId": "",
+        "fieldClientId_Value": client_id,
+        "fieldClientId_SelIndex": -1,
+        "fieldProjectId_Value": project_id,
+        "fieldProjectId_SelIndex": -1,
+        "fieldTaskCode_Value": "CONS",
+        "fieldTaskCode_SelIndex": -1,
+        "fieldPhaseId": "",
+        "fieldPhaseId_current": "",
+        "fieldPhaseIdReal": "",
+        "fieldMSProjectCode": "",
+        "fieldMsProject": "",
+        "fieldDescription_Value": description,
+        "fieldDescription": description,
+        "fieldDescription_SelIndex": "-1",
+        "fieldReference": "",
+        "fieldIsPrintOnInvoice": "fieldIsPrintOnInvoice",
+        "fieldDepartmentId_Value": "",
+        "fieldDepartmentId": "",
+        "fieldDepartmentId_SelIndex": -1,
+        "fieldPayCode_Value": "REG",
+        "fieldPayCode": "Regular (REG)",
+        "fieldPayCode_SelIndex": -1,
+        "fieldIsAffectingTimebank": "fieldIsAffectingTimebank",
+        "fieldQuantity": str(hours) + " hrs",
+        "fieldTimeStart_Value": "",
+        "fieldTimeStart": "",
+        "fieldTimeStart_SelIndex": -1,
+        "fieldTimeEnd_Value": "",
+        "fieldTimeEnd": "",
+        "fieldTimeEnd_SelIndex": -1,
+        "fieldLunchTime": "0.00 hrs",
+        "fieldIsBillable": "fieldIsBillable",
+        "fieldBillableQuantity": str(hours) + " hrs",
+        "panelGroupInvoicableTimesheetDetailFieldUnitCost": "0.0000 $",
+        "TimesheetDetailFieldSubTotal": "0.00 $",
+        "fieldEmployeeTimesheetDetail": "",
+        "fieldNote": "",
+        "billableDescriptionTimesheetDetail": "",
+        "fieldBillableNoteTimesheetDetail": "",
+        "tabPanel_ActiveTab": {"tabDetail": 0},
+    }
+    timesheet_entry = httprequest("POST", body, "/Abak/Timesheet/Edit", headers=headers)
+    store.mark_dirty([store.month_key(day)], config=config)
+    if not timesheet_entry.get("success"):
+        raise Sorry(
+            timesheet_entry.get(
+                "extraParams", {"Message": "there was an error with your request"}
+            ).get("Message")
+        )
+    return (
+        timesheet_entry.get("extraParams", {"newID": ""}).get("newID") or timesheet_id
+    )
+
+
+def enable_memory_cache(ttl):
+    """
+    Keeps the transactions of each range in memory for ttl seconds, or until the CLI
+    changes transactions in Abak. Only worth it in a process that stays up.
+    """
+    global _memory_cache_ttl
+    _memory_cache_ttl = ttl
+    with _memory_cache_lock:
+        _memory_cache.clear()
+
+
+def get_transactions(date, query_range, refresh=False):
+    """
+    Gets the transactions of the employee for the range that contains the date, from the
+    local store when its months are closed, otherwise from Abak
+
+    Args:
+        date (str): reference date, in the format of the config key "date_format"
+        query_range (str): "Daily", "Weekly" or "Monthly"
+        refresh (bool): skips the transactions kept in memory
+
+    Returns:
+        list: the transactions, with their dates in ISO format
+    """
+    config = get_config()
+    try:
+        day = datetime.strptime(date, config["date_format"]).date()
+    except ValueError:
+        return fetch_transactions(date, query_range)
+    if not _memory_cache_ttl:
+        return get_stored_transactions(date, day, query_range, config)
+
+    key = (
+        config.get("endpoint"),
+        config.get("user_id"),
+        query_range,
+        store.candidate_ranges(day, query_range)[0],
+    )
+    with _memory_cache_lock:
+        cached = _memory_cache.get(key)
+    if (
+        cached
+        and not refresh
+        and time.time() - cached[0] < _memory_cache_ttl
+        and cached[0] > store.last_change(config)
+    ):
+        return copy.deepcopy(cached[1])
+    # The time of the request, a change made while it runs makes it stale
+    fetched_at = time.time()
+    transactions = get_stored_transactions(date, day, query_range, config)
+    with _memory_cache_lock:
+        _memory_cache[key] = (fetched_at, copy.deepcopy(transactions))
+    return transactions
+
+
+def get_stored_transactions(date, day, query_range, config):
+    stored = store.read_ranges(store.candidate_ranges(day, query_range), config)
+    if stored is not None:
+        return stored
+    transactions = fetch_transactions(date, query_range)
+    if query_range == "Monthly" and store.is_store_enabled(config):
+        store.save_month(store.month_key(day), transactions, config)
+    return transactions
+
+
+def fetch_transactions(date, query_range):
+    """
+    Gets the transactions of the employee for the range that contains the date from Abak
+
+    Args:
+        date (str): reference date, in the format of the config key "date_format"
+        query_range (str): "Daily", "Weekly" or "Monthly"
+
+    Returns:
+        list: the transactions, with their dates in ISO format
+    """
+    config = get_config()
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    body = {
+        "groupBy": "TransactType",
+        "groupDir": "ASC",
+        "summaryFields": "Quantity",
+        "summaryTypes": "sum",
+        "sort": "Date",
+        "dir": "ASC",
+        "employe": config["user_id"],
+        "date": date + "T00:00:00",
+        "range": query_range,
+    }
+    output_value = httprequest(
+        "POST", body, "/Abak/Transact/GetGroupedTransacts", headers=headers
+    )
+    return output_value.get("data")
+
+
+def delete_timesheet_entries(timesheet_ids):
+    """
+    Deletes all the given timesheet entries in a single request
+    """
+    headers = {"Content-Type": "application/json; charset=utf-8"}
+    body = {
+        "transacts": [
+            {"key": timesheet_id, "value": "T"} for timesheet_id in timesheet_ids
+        ]
+    }
+    result = httprequest(
+        "POST", body, "/Abak/Transact/DeleteTransacts", is_json=True, headers=headers
+    )
+    store.mark_dirty(transaction_ids=timesheet_ids)
+    return result
+
+
+def sync_month(month):
+    """
+    Fetches a month from Abak into the local store
+
+    Args:
+        month (str): the month, as "YYYY-MM"
+
+    Returns:
+        int: the number of transactions of the month
+    """
+    config = get_config()
+    first_day = store.month_bounds(month)[0]
+    transactions = fetch_transactions(
+        first_day.strftime(config["date_format"]), "Monthly"
+    )
+    store.save_month(month, transactions, config)
+    return len(transactions)
+
+
+def transaction_day(transaction):
+    """
+    Returns:
+        datetime.date: the day of a transaction returned by GetGroupedTransacts
+    """
+    return datetime.strptime(transaction["Date"][:10], "%Y-%m-%d").date()
+
+
+def build_project_name_index(contexts_by_project):
+    """
+    Indexes the contexts by the display name of their project, and by its first 60
+    characters when no other project shares them
+    """
+    index = {}
+    prefixes = {}
+    for project in get_projects(None, "", "python"):
+        context = contexts_by_project.get(str(project["Id"]))
+        if context:
+            index[project["Display"]] = context
+        prefixes.setdefault(project["Display"][0:60], set()).add(context)
+    for prefix, found in prefixes.items():
+        if len(found) == 1 and None not in found:
+            index.setdefault(prefix, found.pop())
+    return index
+
+
+def get_context_resolver(transactions, contexts):
+    """
+    Builds a function that returns the name of the context of a transaction
+
+    Transactions are matched by the Id of their client and project. The catalog of
+    projects is only fetched, to match them by name, when a transaction has no ProjectId.
+
+    Args:
+        transactions (list): the transactions to resolve
+        contexts (dict): the contexts of the configuration
+
+    Returns:
+        function: takes a transaction and returns its context name or None
+    """
+    contexts_by_project = {}
+    contexts_by_client_project = {}
+    for name, context in contexts.items():
+        project_id = str(context.get("Project"))
+        contexts_by_project.setdefault(project_id, name)
+        contexts_by_client_project.setdefault(
+            (str(context.get("Client")), project_id), name
+        )
+
+    contexts_by_name = {}
+    if contexts and any(
+        transaction.get("ProjectId") is None for transaction in transactions
+    ):
+        contexts_by_name = build_project_name_index(contexts_by_project)
+
+    def resolve_context(transaction):
+        project_id = transaction.get("ProjectId")
+        if project_id is not None:
+            return contexts_by_client_project.get(
+                (str(transaction.get("ClientId")), str(project_id)),
+                contexts_by_project.get(str(project_id)),
+            )
+        project_name = transaction.get("ProjectName") or ""
+        return contexts_by_name.get(project_name) or contexts_by_name.get(
+            project_name[0:60]
+        )
+
+    return resolve_context
+
+
+def filter_transactions(
+    transactions, resolve_context, context=None, project=None, description=None
+):
+    """
+    Keeps the transactions matching every given filter
+
+    Args:
+        transactions (list): transactions returned by GetGroupedTransacts
+        resolve_context (function): returns the context name of a transaction
+        context (str): name of their context
+        project (str): ID of their project, or part of its name
+        description (str): regular expression searched in their description, ignoring
+            the case
+
+    Returns:
+        list: the matching transactions
+    """
+    if description:
+        try:
+            pattern = re.compile(description, re.IGNORECASE)
+        except re.error as error:
+            raise Sorry(f"'{description}' is not a valid regular expression: {error}")
+    return [
+        transaction
+        for transaction in transactions
+        if (not context or resolve_context(transaction) == context)
+        and (
+            not project
+            or str(transaction.get("ProjectId")) == project
+            or project.lower() in (transaction.get("ProjectName") or "").lower()
+        )
+        and (not description or pattern.search(transaction.get("Description") or ""))
+    ]
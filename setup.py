@@ -29,7 +29,7 @@ setup(
     ],
     entry_points="""
         [console_scripts]
-        abak=abak:abak
+        abak=fancy_abak.daemon_client:main
     """,
     long_description="CLI Tool to interface with Abak",
 )